@@ -1,25 +1,105 @@
-import instructor
-from pydantic import BaseModel, Field, field_validator
+import asyncio
+import functools
+import time
+from pydantic import BaseModel, Field, ValidationError, field_validator
 from typing import Optional, List, Literal
 import os
-import re
 from enum import Enum
 
+from app.config import settings
+from app.intent_cache import IntentCache, catalog_fingerprint
+from app.llm_guard import BREAKER_STATES, CircuitBreaker, ConcurrencyLimit
+from app.metrics import registry, CASCADE_DECISIONS, INTENTS, LLM_BATCH_SIZE, LLM_FALLBACKS, LLM_REQUEST_SECONDS, LLM_RETRIES
+from app.parse_batcher import MicroBatcher
+from app.parser_engine import get_engine
+from app.single_flight import SingleFlight
+
 
 api_key = os.getenv("OPENAI_API_KEY")
 base_url = os.getenv("OPENAI_BASE_URL", "http://localhost:11434/v1")
 
 
-client = None
-if api_key and api_key != "dummy-key-for-testing":
+def _build_client():
+    """Create the Instructor client, or None when no API key is configured"""
+    if not api_key or api_key == "dummy-key-for-testing":
+        return None
     try:
-        client = instructor.from_provider(
+        # Imported here: instructor pulls in the OpenAI SDK, most of a worker's import time
+        import instructor
+        
+        built = instructor.from_provider(
             "openai/gpt-3.5-turbo",
             api_key=api_key,
-            base_url=base_url
+            base_url=base_url,
+            async_client=True
         )
     except Exception:
-        client = None
+        return None
+    # Instructor retries internally; these hooks fire once per failed attempt
+    built.on("parse:error", lambda error: LLM_RETRIES.inc(kind="parse"))
+    built.on("completion:error", lambda error: LLM_RETRIES.inc(kind="completion"))
+    return built
+
+_NOT_BUILT = object()
+
+# STARTUP_MODE=lazy defers building the client (and importing the OpenAI SDK) to the first parse
+client = _build_client() if settings.startup_mode != "lazy" else _NOT_BUILT
+
+_client_build: Optional["asyncio.Future"] = None
+
+def get_client():
+    """The LLM client, or None when AI parsing is not configured"""
+    global client
+    if client is _NOT_BUILT:
+        client = _build_client()
+    return client
+
+def start_client_build() -> "asyncio.Future":
+    """Build the lazy client once on a worker thread, so the SDK import never stalls the event loop"""
+    global _client_build
+    if _client_build is None:
+        _client_build = asyncio.get_running_loop().run_in_executor(None, _build_client)
+    return _client_build
+
+async def ensure_client():
+    """get_client for request handlers: waits for the background build instead of importing inline"""
+    global client
+    if client is _NOT_BUILT:
+        built = await asyncio.shield(start_client_build())
+        if client is _NOT_BUILT:
+            client = built
+    return client
+
+intent_cache = IntentCache(settings.intent_cache_size, settings.intent_cache_ttl)
+registry.gauge(
+    "soda_intent_cache", "Intent parse cache counters", ["stat"],
+    lambda: {(stat,): value for stat, value in intent_cache.stats().items() if stat not in ("maxsize", "ttl_seconds")}
+)
+
+# Identical messages arriving together share one upstream LLM call
+parse_flights = SingleFlight()
+registry.gauge(
+    "soda_llm_single_flight", "LLM calls started (leaders), requests that joined one (followers), calls in flight",
+    ["stat"],
+    lambda: {("leaders",): parse_flights.leaders, ("followers",): parse_flights.followers,
+             ("in_flight",): parse_flights.in_flight()}
+)
+
+# Upstream protection: a concurrency cap and a breaker that sends traffic to the local parser
+llm_limit = ConcurrencyLimit(settings.llm_max_concurrency)
+llm_breaker = CircuitBreaker(settings.llm_breaker_failures, settings.llm_breaker_reset)
+registry.gauge(
+    "soda_llm_concurrency", "LLM calls in flight, waiting for a slot, and the cap (0 = unlimited)", ["stat"],
+    lambda: {(stat,): value for stat, value in llm_limit.stats().items()}
+)
+registry.gauge(
+    "soda_llm_breaker_state", "LLM circuit breaker state (0 closed, 1 half-open, 2 open)", [],
+    lambda: {(): BREAKER_STATES[llm_breaker.state]}
+)
+registry.gauge(
+    "soda_llm_breaker", "LLM circuit breaker counters", ["stat"],
+    lambda: {(stat,): llm_breaker.stats()[stat] for stat in ("consecutive_failures", "open_for_seconds", "trips", "rejected")}
+)
 
 class IntentType(str, Enum):
     """Enum for different types of user intents"""
@@ -29,6 +109,18 @@ class IntentType(str, Enum):
     REFUSE = "refuse"
     UNKNOWN = "unknown"
 
+class LineItem(BaseModel):
+    """One product and quantity within a purchase"""
+    product_name: str = Field(description="Name of the product to purchase")
+    quantity: int = Field(default=1, description="Quantity of this product")
+    
+    @field_validator('quantity')
+    @classmethod
+    def validate_quantity(cls, v):
+        if v <= 0:
+            raise ValueError('Quantity must be positive')
+        return v
+
 class PurchaseIntent(BaseModel):
     """Parsed purchase intent from natural language with enhanced validation"""
     intent: IntentType = Field(description="The user's intent: purchase, query, cancel, refuse, or unknown")
@@ -36,6 +128,7 @@ class PurchaseIntent(BaseModel):
     quantity: Optional[int] = Field(default=None, description="Quantity to purchase")
     confidence: float = Field(ge=0.0, le=1.0, description="Confidence score for the parsing (0-1)")
     reasoning: str = Field(description="Brief explanation of why this intent was chosen")
+    items: List[LineItem] = Field(default_factory=list, description="Every product and quantity when the purchase names more than one product")
     
     @field_validator('quantity')
     @classmethod
@@ -51,23 +144,59 @@ class PurchaseIntent(BaseModel):
             raise ValueError('Confidence must be between 0 and 1')
         return v
     
+    def line_items(self) -> List[LineItem]:
+        """All line items of a purchase, single-product purchases included"""
+        if self.items:
+            return self.items
+        if self.product_name:
+            return [LineItem(product_name=self.product_name, quantity=self.quantity or 1)]
+        return []
+    
     @classmethod
-    def from_message(cls, message: str, available_products: List[str]) -> "PurchaseIntent":
+    async def from_message(cls, message: str, available_products: List[str]) -> "PurchaseIntent":
         """Parse natural language message into purchase intent with enhanced logic"""
         
-        if client is not None:
-            return cls._ai_parse(message, available_products)
+        if client is _NOT_BUILT and not start_client_build().done():
+            # Lazy startup with the client still building: a parse the local tier is sure of does not wait
+            local = cls._enhanced_fallback_parse(message, available_products)
+            if escalation_reason(local, available_products) is None:
+                LLM_FALLBACKS.inc(reason="client_starting")
+                return local
+        if await ensure_client() is not None:
+            if settings.parse_mode == "cascade":
+                local = cls._enhanced_fallback_parse(message, available_products)
+                reason = escalation_reason(local, available_products)
+                if reason is None:
+                    CASCADE_DECISIONS.inc(tier="local", reason="accepted")
+                    return local
+                CASCADE_DECISIONS.inc(tier="llm", reason=reason)
+            key = intent_cache.key(message, available_products)
+            cached = intent_cache.get(key) if intent_cache.enabled else None
+            if cached is not None:
+                return cached
+            if parse_batcher.enabled:
+                def parse():
+                    return parse_batcher.submit(catalog_fingerprint(available_products), message, available_products)
+            else:
+                def parse():
+                    return cls._ai_parse(message, available_products)
+            # Followers get the leader's outcome, fallback included; copies keep requests independent
+            intent = await parse_flights.do(key, parse)
+            return intent.model_copy()
         else:
             return cls._enhanced_fallback_parse(message, available_products)
     
-    @classmethod
-    def _ai_parse(cls, message: str, available_products: List[str]) -> "PurchaseIntent":
-        """AI-powered parsing using Instructor"""
-        system_prompt = f"""
+    @staticmethod
+    def _system_prompt(available_products: List[str]) -> str:
+        return _system_prompt(tuple(available_products))
+    
+    @staticmethod
+    def _prompt_template(products: str) -> str:
+        return f"""
         You are an AI assistant for a soda vending machine. 
         Parse the user's message and extract their intent with high accuracy.
         
-        Available products: {', '.join(available_products)}
+        Available products: {products}
         
         Rules:
         1. INTENT DETECTION:
@@ -85,6 +214,7 @@ class PurchaseIntent(BaseModel):
            - Extract numbers followed by product names
            - Default to 1 if not specified
            - Handle "a", "an", "one" as quantity 1
+           - When several products are named, list each one with its quantity in "items"
         
         4. CONFIDENCE SCORING:
            - 0.9-1.0: Very clear intent
@@ -96,65 +226,66 @@ class PurchaseIntent(BaseModel):
         Examples:
         - "I want to buy 3 cokes" → purchase, coke, 3, 0.95
         - "Give me a sprite" → purchase, sprite, 1, 0.9
+        - "2 cokes and a fanta" → purchase, coke, 2, 0.9, items: [coke x2, fanta x1]
         - "What do you have?" → query, null, null, 0.95
         - "I don't want to buy anything" → refuse, null, null, 0.9
         - "Cancel my order" → cancel, null, null, 0.9
         """
-        
-        try:
-            response = client.chat.completions.create(
-                response_model=PurchaseIntent,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": message}
-                ],
-                max_retries=3
-            )
-            return response
-        except Exception as e:
-            
+    
+    @classmethod
+    async def _ai_parse(cls, message: str, available_products: List[str]) -> "PurchaseIntent":
+        """AI-powered parsing using Instructor"""
+        response = await _guarded_completion(
+            PurchaseIntent,
+            [
+                {"role": "system", "content": cls._system_prompt(available_products)},
+                {"role": "user", "content": message}
+            ]
+        )
+        if response is None:
             return cls._enhanced_fallback_parse(message, available_products)
+        intent_cache.put(intent_cache.key(message, available_products), response)
+        return response
+    
+    @classmethod
+    async def _ai_parse_batch(cls, messages: List[str], available_products: List[str]) -> List["PurchaseIntent"]:
+        """Parse several messages with one LLM call; any message without a valid answer falls back on its own"""
+        numbered = "\n".join(f"[{index}] {' '.join(message.split())}" for index, message in enumerate(messages))
+        response = await _guarded_completion(
+            PurchaseIntentBatch,
+            [
+                {"role": "system", "content": cls._system_prompt(available_products) + BATCH_INSTRUCTIONS},
+                {"role": "user", "content": numbered}
+            ],
+            messages=len(messages)
+        )
+        answers = {}
+        for answer in (response.intents if response is not None else []):
+            try:
+                answers.setdefault(answer.index, PurchaseIntent.model_validate(answer.model_dump(exclude={"index"})))
+            except ValidationError:
+                continue
+        
+        intents = []
+        for index, message in enumerate(messages):
+            intent = answers.get(index)
+            if intent is None:
+                if response is not None:
+                    LLM_FALLBACKS.inc(reason="batch_item_invalid")
+                intent = cls._enhanced_fallback_parse(message, available_products)
+            else:
+                intent_cache.put(intent_cache.key(message, available_products), intent)
+            intents.append(intent)
+        return intents
     
     @classmethod
     def _enhanced_fallback_parse(cls, message: str, available_products: List[str]) -> "PurchaseIntent":
         """Enhanced fallback parser with better intent detection"""
         message_lower = message.lower().strip()
+        engine = get_engine(available_products)
         
-       
-        negative_patterns = [
-            r'\b(?:dont|don\'t|not|no|never|refuse|decline|cancel|stop)\b',
-            r'\b(?:dont|don\'t)\s+(?:want|need|buy|purchase)\b',
-            r'\b(?:not|no)\s+(?:thanks|thank you|interested)\b'
-        ]
-        
-        has_negative = any(re.search(pattern, message_lower) for pattern in negative_patterns)
-        
-        
-        purchase_patterns = [
-            r'\b(?:buy|purchase|get|want|need)\b',
-            r'\b(?:give me|i\'ll take|i want)\b',
-            r'\b(?:can i have|may i have)\b'
-        ]
-        
-        has_purchase_keyword = any(re.search(pattern, message_lower) for pattern in purchase_patterns)
-        
-        
-        query_patterns = [
-            r'\b(?:what|which|how many|show me|list|available)\b',
-            r'\b(?:do you have|what\'s available)\b',
-            r'\b(?:inventory|stock|products)\b'
-        ]
-        
-        has_query_keyword = any(re.search(pattern, message_lower) for pattern in query_patterns)
-        
-        
-        cancel_patterns = [
-            r'\b(?:cancel|stop|abort|undo)\b',
-            r'\b(?:never mind|forget it)\b'
-        ]
-        
-        has_cancel_keyword = any(re.search(pattern, message_lower) for pattern in cancel_patterns)
-        
+        has_negative, has_purchase_keyword, has_query_keyword, has_cancel_keyword = engine.classify(message_lower)
+        items = engine.extract_items(message_lower)
         
         if has_negative and has_purchase_keyword:
             return cls(
@@ -180,19 +311,28 @@ class PurchaseIntent(BaseModel):
                 confidence=0.85,
                 reasoning="User asked about inventory/products"
             )
-        elif has_purchase_keyword and not has_negative:
+        elif (has_purchase_keyword or engine.is_item_list(message_lower)) and not has_negative:
+            # Naming a product is not asking to buy it; only a counted list like "2 cokes and a fanta" is an order without a verb
+            product_name = engine.extract_product(message_lower)
+            quantity = engine.extract_quantity(message_lower)
+            if items and items[0][0] == product_name and (len(items) > 1 or items[0][1] > quantity):
+                # Repeated mentions add up: "a coke and a coke" is 2
+                quantity = items[0][1]
+            if len(items) < 2:
+                items = []
             
-            product_name = cls._extract_product(message_lower, available_products)
-            quantity = cls._extract_quantity(message_lower)
-            
-            confidence = 0.7 if product_name else 0.3
+            if has_purchase_keyword:
+                confidence = 0.7 if product_name else 0.3
+            else:
+                confidence = 0.6
             
             return cls(
                 intent=IntentType.PURCHASE,
                 product_name=product_name,
                 quantity=quantity,
                 confidence=confidence,
-                reasoning=f"Purchase intent detected. Product: {product_name}, Quantity: {quantity}"
+                reasoning=f"Purchase intent detected{'' if has_purchase_keyword else ' from product mentions'}. Product: {product_name}, Quantity: {quantity}",
+                items=[LineItem(product_name=name, quantity=count) for name, count in items]
             )
         else:
             return cls(
@@ -206,32 +346,112 @@ class PurchaseIntent(BaseModel):
     @staticmethod
     def _extract_product(message: str, available_products: List[str]) -> Optional[str]:
         """Extract product name from message"""
-        for product in available_products:
-            if product in message:
-                return product
-        return None
+        return get_engine(available_products).extract_product(message)
     
     @staticmethod
-    def _extract_quantity(message: str) -> int:
+    def _extract_quantity(message: str, available_products: List[str]) -> int:
         """Extract quantity from message"""
-        
-        quantity_patterns = [
-            r'(\d+)\s*(?:cans?|bottles?|sodas?|cokes?|pepsis?|sprites?|fantas?|mountain\s*dews?|dr\s*peppers?)',
-            r'(?:buy|get|want|need)\s+(\d+)',
-            r'(\d+)\s+(?:coke|pepsi|sprite|fanta|mountain\s*dew|dr\s*pepper)'
-        ]
-        
-        for pattern in quantity_patterns:
-            match = re.search(pattern, message)
-            if match:
-                return int(match.group(1))
-        
-        
-        if re.search(r'\b(?:a|an)\s+(?:coke|pepsi|sprite|fanta|mountain\s*dew|dr\s*pepper)', message):
-            return 1
-        
-        return 1  
+        return get_engine(available_products).extract_quantity(message)
+
+@functools.lru_cache(maxsize=8)
+def _system_prompt(available_products: tuple) -> str:
+    """Rendered system prompt for one product list; the catalog hands out the same tuple until it changes"""
+    return PurchaseIntent._prompt_template(", ".join(available_products))
+
+class BatchAnswer(BaseModel):
+    """One message's intent within a batched parse; validated into a PurchaseIntent per message"""
+    index: int = Field(description="Number of the message this intent belongs to")
+    intent: str = Field(description="The user's intent: purchase, query, cancel, refuse, or unknown")
+    product_name: Optional[str] = Field(default=None, description="Name of the product to purchase")
+    quantity: Optional[int] = Field(default=None, description="Quantity to purchase")
+    confidence: float = Field(default=0.0, description="Confidence score for the parsing (0-1)")
+    reasoning: str = Field(default="", description="Brief explanation of why this intent was chosen")
+    items: List[LineItem] = Field(default_factory=list, description="Every product and quantity when the purchase names more than one product")
+
+class PurchaseIntentBatch(BaseModel):
+    """Intents for a numbered list of messages"""
+    intents: List[BatchAnswer] = Field(description="One intent per message, in any order")
+
+BATCH_INSTRUCTIONS = """
+        The user turn holds several independent messages, one per line, each prefixed
+        with its number in brackets. Parse each one on its own and return one entry per
+        message in "intents", with "index" set to that message's number.
+        """
+
+async def _guarded_completion(response_model, chat_messages: List[dict], messages: int = 1):
+    """Call the LLM within the breaker, concurrency cap and timeout budget; None means fall back"""
+    if not llm_breaker.allow():
+        LLM_FALLBACKS.inc(messages, reason="circuit_open")
+        return None
+    
+    # One budget covers the wait for a slot and every retry
+    budget = settings.llm_timeout if settings.llm_timeout > 0 else None
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(llm_limit.acquire(), budget)
+    except asyncio.TimeoutError:
+        # Local saturation says nothing about the upstream, so the breaker is left alone
+        llm_breaker.record_abandoned()
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome="saturated")
+        LLM_FALLBACKS.inc(messages, reason="saturated")
+        return None
+    except BaseException:
+        llm_breaker.record_abandoned()
+        raise
+    
+    try:
+        response = await asyncio.wait_for(
+            get_client().chat.completions.create(
+                response_model=response_model,
+                messages=chat_messages,
+                max_retries=settings.llm_max_retries
+            ),
+            None if budget is None else max(budget - (time.perf_counter() - started), 0.001)
+        )
+        llm_breaker.record_success()
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome="success")
+        return response
+    except asyncio.TimeoutError:
+        llm_breaker.record_failure()
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome="timeout")
+        LLM_FALLBACKS.inc(messages, reason="timeout")
+        return None
+    except asyncio.CancelledError:
+        llm_breaker.record_abandoned()
+        raise
+    except Exception as e:
+        llm_breaker.record_failure()
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome="failure")
+        LLM_FALLBACKS.inc(messages, reason=type(e).__name__)
+        return None
+    finally:
+        llm_limit.release()
+
+async def _parse_batch(messages: List[str], available_products: List[str]) -> List[PurchaseIntent]:
+    LLM_BATCH_SIZE.observe(len(messages))
+    if len(messages) == 1:
+        return [await PurchaseIntent._ai_parse(messages[0], available_products)]
+    return await PurchaseIntent._ai_parse_batch(messages, available_products)
+
+# Optional micro-batching of concurrent LLM parses that share a product list
+parse_batcher = MicroBatcher(_parse_batch, settings.parse_batch_max_size, settings.parse_batch_max_wait_ms / 1000)
+
+def escalation_reason(
+    intent: PurchaseIntent, available_products: List[str], threshold: Optional[float] = None
+) -> Optional[str]:
+    """Why a local parse needs the LLM in cascade mode, or None when it can be used as is"""
+    if threshold is None:
+        threshold = settings.cascade_confidence_threshold
+    if intent.confidence < threshold:
+        return "low_confidence"
+    if intent.intent == IntentType.PURCHASE:
+        items = intent.line_items()
+        if not items or any(item.product_name not in available_products for item in items):
+            return "unresolved_product"
+    return None
 
-def parse_purchase_request(message: str, available_products: List[str]) -> PurchaseIntent:
+async def parse_purchase_request(message: str, available_products: List[str]) -> PurchaseIntent:
     """Parse a natural language purchase request with enhanced validation"""
-    return PurchaseIntent.from_message(message, available_products) 
\ No newline at end of file
+    intent = await PurchaseIntent.from_message(message, available_products)
+    INTENTS.inc(intent=intent.intent.value)
+    return intent 
\ No newline at end of file
@@ -0,0 +1,122 @@
+import argparse
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, Index, MetaData, Table, func, insert
+from sqlmodel import Session, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import settings
+from app.database import engine
+from app.models import LedgerArchive, Transaction
+
+# Archive tables live outside SQLModel.metadata so create_all never touches them
+_archive_metadata = MetaData()
+_archive_tables: Dict[str, Table] = {}
+
+
+def month_start(moment: datetime) -> datetime:
+    """Truncate a timestamp to the first day of its month"""
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def archive_table_name(period_start: datetime) -> str:
+    return f"transaction_archive_{period_start:%Y%m}"
+
+
+def archive_table(name: str) -> Table:
+    """Table object for one monthly archive: the ledger's columns, no foreign keys, one keyset index"""
+    table = _archive_tables.get(name)
+    if table is None:
+        columns = [
+            Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+            for column in Transaction.__table__.columns
+        ]
+        table = Table(name, _archive_metadata, *columns, Index(f"ix_{name}_created_at_id", "created_at", "id"))
+        _archive_tables[name] = table
+    return table
+
+
+def _record_manifest(session: Session, name: str, period_start: datetime, rows: int,
+                     first_created_at: datetime, last_created_at: datetime):
+    entry = session.get(LedgerArchive, name)
+    if entry is None:
+        entry = LedgerArchive(table_name=name, period_start=period_start, rows=0,
+                              first_created_at=first_created_at, last_created_at=last_created_at)
+    entry.rows += rows
+    entry.first_created_at = min(entry.first_created_at, first_created_at)
+    entry.last_created_at = max(entry.last_created_at, last_created_at)
+    entry.updated_at = datetime.utcnow()
+    session.add(entry)
+
+
+def archive_ledger(older_than: timedelta, batch_size: int = 2000, pause: float = 0.05,
+                   max_batches: Optional[int] = None) -> int:
+    """Move transactions older than `older_than` into monthly archive tables, one short transaction per batch"""
+    if older_than <= timedelta(0):
+        # Readers chain archive and hot table by time, so archived rows must all be older than hot ones
+        raise ValueError("older_than must be positive")
+    cutoff = datetime.utcnow() - older_than
+    ledger = Transaction.__table__
+    moved, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        with Session(engine) as session:
+            # The newest row stays, so SQLite never hands out an archived id again
+            newest_id = session.exec(select(func.max(Transaction.id))).one()
+            rows = session.exec(
+                select(Transaction.id, Transaction.created_at)
+                .where(Transaction.created_at < cutoff, Transaction.id != newest_id)
+                .order_by(Transaction.created_at, Transaction.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            by_month = defaultdict(list)
+            for row_id, created_at in rows:
+                by_month[month_start(created_at)].append((row_id, created_at))
+            for period_start, month_rows in by_month.items():
+                name = archive_table_name(period_start)
+                table = archive_table(name)
+                table.create(session.connection(), checkfirst=True)
+                ids = [row_id for row_id, _ in month_rows]
+                session.exec(insert(table).from_select(
+                    [column.name for column in ledger.columns],
+                    select(*ledger.columns).where(ledger.c.id.in_(ids))
+                ))
+                _record_manifest(session, name, period_start, len(ids), month_rows[0][1], month_rows[-1][1])
+            session.exec(delete(Transaction).where(Transaction.id.in_([row_id for row_id, _ in rows])))
+            session.commit()
+        moved += len(rows)
+        batches += 1
+        # Let queued writers take the lock between batches
+        time.sleep(pause)
+    return moved
+
+
+def archived_tables_sync(session: Session) -> List[LedgerArchive]:
+    """Manifest entries, oldest month first"""
+    return list(session.exec(select(LedgerArchive).order_by(LedgerArchive.period_start)).all())
+
+
+async def archived_tables(session: AsyncSession, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None) -> List[LedgerArchive]:
+    """Manifest entries that may hold rows in [since, until], oldest month first"""
+    statement = select(LedgerArchive).order_by(LedgerArchive.period_start)
+    if since is not None:
+        statement = statement.where(LedgerArchive.last_created_at >= since)
+    if until is not None:
+        statement = statement.where(LedgerArchive.first_created_at <= until)
+    return list((await session.exec(statement)).all())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old transactions into monthly archive tables")
+    parser.add_argument("--older-than-days", type=float, default=settings.archive_after_days)
+    parser.add_argument("--batch-size", type=int, default=settings.archive_batch_size)
+    parser.add_argument("--pause-ms", type=float, default=settings.archive_batch_pause_ms)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    count = archive_ledger(timedelta(days=args.older_than_days), args.batch_size, args.pause_ms / 1000)
+    print(f"✅ Archived {count} transactions in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,138 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.metrics import registry
+from app.models import Product
+
+
+@dataclass
+class CatalogEntry:
+    """Cached view of a product row"""
+    id: int
+    name: str
+    price: float
+    stock: int
+
+
+# Changed fields of one product, keyed like the row: {"id": 1, "stock": 4}
+CatalogChange = Dict[str, object]
+_FIELDS = ("name", "price", "stock")
+
+
+def _diff(old: Optional[CatalogEntry], new: CatalogEntry) -> Optional[CatalogChange]:
+    changed = {field: getattr(new, field) for field in _FIELDS if old is None or getattr(old, field) != getattr(new, field)}
+    return {"id": new.id, **changed} if changed else None
+
+
+class ProductCatalog:
+    """Versioned in-memory product catalog shared by the parser and the router"""
+
+    def __init__(self):
+        self._by_name: Dict[str, CatalogEntry] = {}
+        self._by_id: Dict[int, CatalogEntry] = {}
+        self._names: Tuple[str, ...] = ()
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self.version = 0
+        self._listeners: List[Callable[[List[CatalogChange]], None]] = []
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def add_listener(self, listener: Callable[[List[CatalogChange]], None]):
+        """Call listener with the changed fields of every product that changed"""
+        self._listeners.append(listener)
+
+    def _notify(self, changes: List[CatalogChange]):
+        if not changes:
+            return
+        for listener in self._listeners:
+            listener(changes)
+
+    def load(self, products: Iterable[Product]):
+        """Replace the catalog contents with the given product rows"""
+        previous = self._by_id
+        self._by_name = {}
+        self._by_id = {}
+        changes = []
+        for product in products:
+            entry = CatalogEntry(id=product.id, name=product.name, price=product.price, stock=product.stock)
+            self._by_name[entry.name] = entry
+            self._by_id[entry.id] = entry
+            change = _diff(previous.get(entry.id), entry)
+            if change is not None:
+                changes.append(change)
+        self._names = tuple(self._by_name)
+        self._loaded = True
+        self.version += 1
+        self._notify(changes)
+
+    async def refresh(self, session: AsyncSession):
+        """Reload the whole catalog from the database"""
+        products = (await session.exec(select(Product))).all()
+        self.load(products)
+
+    async def ensure_loaded(self, session: AsyncSession):
+        """Load the catalog on first use"""
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self.refresh(session)
+
+    def invalidate(self):
+        """Force a reload on next use"""
+        self._loaded = False
+
+    def names(self) -> Tuple[str, ...]:
+        return self._names
+
+    def entries(self) -> List[CatalogEntry]:
+        return list(self._by_name.values())
+
+    def get(self, name: str) -> Optional[CatalogEntry]:
+        return self._by_name.get(name)
+
+    def get_by_id(self, product_id: int) -> Optional[CatalogEntry]:
+        return self._by_id.get(product_id)
+
+    def set_stock(self, product_id: int, stock: int):
+        """Write-through after a committed stock change"""
+        entry = self._by_id.get(product_id)
+        if entry is not None and entry.stock != stock:
+            entry.stock = stock
+            self.version += 1
+            self._notify([{"id": product_id, "stock": stock}])
+
+    def upsert(self, product: Product):
+        """Write-through after a committed insert, restock or price change"""
+        self.upsert_many([product])
+
+    def upsert_many(self, products: Iterable[Product]):
+        """Write-through of several committed product rows, with one version bump and one notification"""
+        changes = []
+        for product in products:
+            entry = self._by_id.get(product.id)
+            new = CatalogEntry(id=product.id, name=product.name, price=product.price, stock=product.stock)
+            change = _diff(entry, new)
+            if change is not None:
+                changes.append(change)
+            if entry is None:
+                entry = new
+                self._by_id[entry.id] = entry
+            else:
+                if entry.name != product.name:
+                    self._by_name.pop(entry.name, None)
+                entry.name, entry.price, entry.stock = product.name, product.price, product.stock
+            self._by_name[entry.name] = entry
+        self._names = tuple(self._by_name)
+        self.version += 1
+        self._notify(changes)
+
+catalog = ProductCatalog()
+registry.gauge("soda_catalog_version", "In-process catalog version", [], lambda: {(): catalog.version})
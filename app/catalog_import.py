@@ -0,0 +1,404 @@
+import argparse
+import asyncio
+import csv
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.catalog_sync import bump_version, catalog_sync, ensure_catalog_version
+from app.config import settings
+from app.database import async_engine, dialect_insert
+from app.machines import bump_stock_versions, machine_stock_upsert
+from app.models import (
+    CatalogImportRow, CatalogImportRowError, CatalogImportSummary, Machine, Product, ProductChange
+)
+
+IMPORT_FORMATS = ("csv", "json", "ndjson")
+IMPORT_MODES = ("add", "set")
+IMPORT_CONTENT_TYPES = {"text/csv": "csv", "application/json": "json", "application/x-ndjson": "ndjson"}
+MAX_REPORTED_ERRORS = 100
+MAX_REPORTED_CHANGES = 100
+READ_CHUNK_CHARS = 64 * 1024
+_PRODUCT_FIELDS = ("price", "description", "category")
+# Straight to pydantic-core; SQLModel's model_validate wrapper costs several times the validation itself
+_validate_row = CatalogImportRow.__pydantic_validator__.validate_python
+# One physical line, ending like csv and io.StringIO(newline="") see lines: \r\n, \r or \n
+_LINE = re.compile(r"[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+\Z")
+_JSON_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class CatalogImportInvalid(Exception):
+    """The import had invalid rows; nothing was written"""
+
+    def __init__(self, errors: List[CatalogImportRowError], total: Optional[int] = None):
+        total = len(errors) if total is None else total
+        super().__init__(f"{total} invalid import rows, nothing was imported")
+        self.errors = errors[:MAX_REPORTED_ERRORS]
+
+
+@dataclass
+class ImportPlan:
+    """Validated import rows, merged per product and per (machine, product)"""
+    mode: str
+    rows: int = 0
+    products: Dict[str, Dict[str, object]] = field(default_factory=dict)
+    machine_stock: Dict[Tuple[int, str], int] = field(default_factory=dict)
+    lines: Dict[str, int] = field(default_factory=dict)
+    errors: List[CatalogImportRowError] = field(default_factory=list)
+    error_count: int = 0
+
+    def error(self, line: Optional[int], message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(CatalogImportRowError(line=line, message=message))
+
+    def add(self, line: int, record: object):
+        """Validate one raw record and merge it; later rows win, stock adds up with mode=add"""
+        self.rows += 1
+        if not isinstance(record, dict):
+            self.error(line, "Expected an object with a name")
+            return
+        try:
+            # Empty CSV cells mean "not given"
+            row = _validate_row({key: value for key, value in record.items() if value not in ("", None)})
+        except ValidationError as e:
+            self.error(line, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            return
+        self.lines.setdefault(row.name, line)
+        attributes = {name: getattr(row, name) for name in _PRODUCT_FIELDS if getattr(row, name) is not None}
+        if row.machine_id is not None:
+            if row.stock is None:
+                self.error(line, "Machine rows need a stock")
+                return
+            key = (row.machine_id, row.name)
+            self.machine_stock[key] = self.machine_stock.get(key, 0) + row.stock if self.mode == "add" else row.stock
+            if attributes:
+                self.products.setdefault(row.name, {}).update(attributes)
+            return
+        entry = self.products.setdefault(row.name, {})
+        entry.update(attributes)
+        if row.stock is not None:
+            entry["stock"] = entry.get("stock", 0) + row.stock if self.mode == "add" else row.stock
+
+
+def _skip_whitespace(text: str, pos: int) -> int:
+    return _WHITESPACE.match(text, pos).end()
+
+
+def format_for_content_type(content_type: Optional[str]) -> Optional[str]:
+    return IMPORT_CONTENT_TYPES.get((content_type or "").split(";")[0].strip().lower())
+
+
+class PlanBuilder:
+    """Validates CSV, NDJSON or JSON-array input as it arrives, in text chunks of any size
+
+    Only the merged plan and at most one unfinished record are kept, never the whole upload.
+    """
+
+    def __init__(self, fmt: str, mode: str):
+        self.fmt = fmt
+        self.plan = ImportPlan(mode=mode)
+        self._partial = ""
+        self._line = 0
+        # CSV: header cells, and the physical lines of a record whose quoted field is still open
+        self._header: Optional[List[str]] = None
+        self._record: List[str] = []
+        self._record_line = 0
+        # JSON arrays: unparsed text, its first line number, and how much of it to wait for
+        # before decoding again, so an element split across chunks is not rescanned per chunk
+        self._json = ""
+        self._json_line = 1
+        self._json_retry_at = 0
+        self._json_state = "start"
+        self._json_index = 0
+
+    def feed(self, text: str):
+        if self.fmt == "json":
+            self._feed_json(text, final=False)
+            return
+        for line in self._lines(text, final=False):
+            self._feed_line(line, final=False)
+
+    def finish(self) -> ImportPlan:
+        """Flush what is left of the input and return the plan"""
+        if self.fmt == "json":
+            self._feed_json("", final=True)
+        else:
+            for line in self._lines("", final=True):
+                self._feed_line(line, final=False)
+            if self._record:
+                self._csv_record(final=True)
+        plan = self.plan
+        if not plan.rows and not plan.error_count:
+            plan.error(None, "No rows to import")
+        return plan
+
+    def _lines(self, text: str, final: bool) -> List[str]:
+        """Complete lines with their endings; a trailing \r waits in case \n follows in the next chunk"""
+        text = self._partial + text
+        if final:
+            self._partial = ""
+            return _LINE.findall(text)
+        end = len(text) - 1 if text.endswith("\r") else len(text)
+        cut = max(text.rfind("\n", 0, end), text.rfind("\r", 0, end)) + 1
+        self._partial = text[cut:]
+        return _LINE.findall(text, 0, cut)
+
+    def _feed_line(self, line: str, final: bool):
+        self._line += 1
+        if self.fmt == "ndjson":
+            if not line.strip():
+                return
+            try:
+                self.plan.add(self._line, json.loads(line))
+            except json.JSONDecodeError as e:
+                self.plan.rows += 1
+                self.plan.error(self._line, f"Invalid JSON: {e.msg}")
+            return
+        if not self._record:
+            self._record_line = self._line
+        self._record.append(line)
+        self._csv_record(final)
+
+    def _csv_record(self, final: bool):
+        lines, self._record = self._record, []
+        if len(lines) == 1 and '"' not in lines[0]:
+            # Unquoted: the csv module would split on commas too
+            stripped = lines[0].rstrip("\r\n")
+            rows = [stripped.split(",")] if stripped else []
+        else:
+            try:
+                rows = list(csv.reader(lines, strict=True))
+            except csv.Error as e:
+                if not final and "unexpected end of data" in str(e):
+                    # A quoted field spans lines; wait for the line that closes it
+                    self._record = lines
+                    return
+                # Parse malformed quoting as leniently as csv.DictReader does
+                rows = list(csv.reader(lines))
+        for row in rows:
+            if self._header is None:
+                self._header = [cell.strip().lower() for cell in row]
+            elif row:
+                # Surplus cells and unnamed columns are dropped, missing cells are not given
+                self.plan.add(self._record_line, {key: value for key, value in zip(self._header, row) if key})
+
+    def _feed_json(self, text: str, final: bool):
+        self._json += text
+        if not final and len(self._json) < self._json_retry_at:
+            return
+        buffer, pos, incomplete = self._json, 0, False
+        while True:
+            pos = _skip_whitespace(buffer, pos)
+            if pos == len(buffer) or self._json_state == "done":
+                break
+            if self._json_state == "start":
+                if buffer[pos] != "[":
+                    self.plan.error(None, "Expected a JSON array of products")
+                    self._json_state = "done"
+                    break
+                pos += 1
+                self._json_state = "first"
+            elif self._json_state == "first" and buffer[pos] == "]":
+                pos += 1
+                self._json_state = "end"
+            elif self._json_state in ("first", "item"):
+                try:
+                    record, end = _JSON_DECODER.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    if not final:
+                        incomplete = True
+                        break
+                    self.plan.error(self._json_line + buffer.count("\n", 0, e.pos), f"Invalid JSON: {e.msg}")
+                    self._json_state = "done"
+                    break
+                if end == len(buffer) and not final:
+                    # A number could go on in the next chunk
+                    incomplete = True
+                    break
+                self._json_index += 1
+                self.plan.add(self._json_index, record)
+                pos = end
+                self._json_state = "next"
+            elif self._json_state == "next" and buffer[pos] in ",]":
+                self._json_state = "item" if buffer[pos] == "," else "end"
+                pos += 1
+            else:
+                message = "Expecting ',' delimiter" if self._json_state == "next" else "Extra data"
+                self.plan.error(self._json_line + buffer.count("\n", 0, pos), f"Invalid JSON: {message}")
+                self._json_state = "done"
+        if final and self._json_state not in ("end", "done"):
+            message = "Expecting ',' delimiter" if self._json_state == "next" else "Expecting value"
+            self.plan.error(self._json_line + buffer.count("\n", 0, pos), f"Invalid JSON: {message}")
+        if self._json_state == "done":
+            # Nothing after a fatal error is read, so nothing more is kept either
+            self._json, self._json_retry_at = "", 0
+            return
+        self._json_line += buffer.count("\n", 0, pos)
+        self._json = buffer[pos:]
+        self._json_retry_at = 2 * len(self._json) if incomplete else 0
+
+
+def build_plan(chunks: Iterable[str], fmt: str, mode: str) -> ImportPlan:
+    """Validate CSV, NDJSON or JSON-array input in one pass over its text, lines or any other chunks"""
+    builder = PlanBuilder(fmt, mode)
+    for chunk in chunks:
+        builder.feed(chunk)
+    return builder.finish()
+
+
+async def apply_import(session: AsyncSession, plan: ImportPlan, dry_run: bool = False) -> CatalogImportSummary:
+    """Upsert the plan in chunks inside one transaction and report what changed"""
+    if plan.error_count:
+        raise CatalogImportInvalid(plan.errors, plan.error_count)
+    chunk = settings.catalog_import_chunk_size
+    dialect_name = session.bind.dialect.name
+    now = datetime.utcnow()
+    # Every product write takes the version row first, so nothing changes the rows read below
+    version = await bump_version(session)
+
+    names = list(plan.products.keys() | {name for _, name in plan.machine_stock})
+    existing = {}
+    for start in range(0, len(names), chunk):
+        rows = (await session.exec(
+            select(Product.id, Product.name, Product.price, Product.stock, Product.description, Product.category)
+            .where(Product.name.in_(names[start:start + chunk]))
+        )).all()
+        existing.update((row.name, row) for row in rows)
+    machine_ids = sorted({machine_id for machine_id, _ in plan.machine_stock})
+    known_machines = set()
+    for start in range(0, len(machine_ids), chunk):
+        known_machines.update((await session.exec(
+            select(Machine.id).where(Machine.id.in_(machine_ids[start:start + chunk]))
+        )).all())
+
+    errors = []
+    for name, entry in plan.products.items():
+        if name not in existing and "price" not in entry:
+            errors.append(CatalogImportRowError(line=plan.lines[name], message=f"New product '{name}' needs a price"))
+    for machine_id, name in plan.machine_stock:
+        if machine_id not in known_machines:
+            errors.append(CatalogImportRowError(line=plan.lines[name], message=f"Machine {machine_id} not found"))
+        elif name not in existing and name not in plan.products:
+            errors.append(CatalogImportRowError(line=plan.lines[name], message=f"Unknown product '{name}'"))
+    if errors:
+        await session.rollback()
+        raise CatalogImportInvalid(sorted(errors, key=lambda error: error.line or 0))
+
+    # Plain counters: attribute writes on the SQLModel summary are slow across 10k products
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    stock_delta = 0
+    changes = []
+    params = []
+    for name, entry in plan.products.items():
+        old = existing.get(name)
+        if old is None:
+            new = {
+                "price": entry["price"],
+                "description": entry.get("description"),
+                "category": entry.get("category", "soda"),
+                "stock": entry.get("stock", 0),
+            }
+            action = "created"
+            stock_delta += new["stock"]
+            stock_param = new["stock"]
+        else:
+            stock = old.stock + entry.get("stock", 0) if plan.mode == "add" else entry.get("stock", old.stock)
+            new = {key: entry.get(key, getattr(old, key)) for key in _PRODUCT_FIELDS}
+            new["stock"] = stock
+            if all(getattr(old, key) == value for key, value in new.items()):
+                counts["unchanged"] += 1
+                continue
+            action = "updated"
+            stock_delta += stock - old.stock
+            # With mode=add the statement adds this to the row's stock itself
+            stock_param = stock - old.stock if plan.mode == "add" else stock
+        counts[action] += 1
+        if len(changes) < MAX_REPORTED_CHANGES:
+            fields = {key: [getattr(old, key, None), value] for key, value in new.items()
+                      if value is not None and getattr(old, key, None) != value}
+            changes.append(ProductChange(name=name, action=action, fields=fields))
+        params.append({**new, "name": name, "stock": stock_param, "created_at": now, "updated_at": now, "version": version})
+
+    summary = CatalogImportSummary(
+        dry_run=dry_run, rows=plan.rows, products_created=counts["created"], products_updated=counts["updated"],
+        products_unchanged=counts["unchanged"], stock_delta=stock_delta, changes=changes,
+        changes_truncated=counts["created"] + counts["updated"] > len(changes),
+    )
+    table = Product.__table__
+    statement = dialect_insert(dialect_name, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["name"],
+        set_={
+            "price": statement.excluded.price,
+            "description": statement.excluded.description,
+            "category": statement.excluded.category,
+            "stock": table.c.stock + statement.excluded.stock if plan.mode == "add" else statement.excluded.stock,
+            "updated_at": statement.excluded.updated_at,
+            "version": statement.excluded.version,
+        },
+    )
+    for start in range(0, len(params), chunk):
+        await session.exec(statement, params=params[start:start + chunk])
+
+    if plan.machine_stock:
+        product_ids = {name: row.id for name, row in existing.items()}
+        created = [name for _, name in plan.machine_stock if name not in product_ids]
+        for start in range(0, len(created), chunk):
+            product_ids.update((await session.exec(
+                select(Product.name, Product.id).where(Product.name.in_(created[start:start + chunk]))
+            )).all())
+        stock_params = [
+            {"machine_id": machine_id, "product_id": product_ids[name], "stock": stock, "updated_at": now}
+            for (machine_id, name), stock in plan.machine_stock.items()
+        ]
+        statement = machine_stock_upsert(dialect_name, add=plan.mode == "add")
+        for start in range(0, len(stock_params), chunk):
+            await session.exec(statement, params=stock_params[start:start + chunk])
+        await bump_stock_versions(session, machine_ids)
+        summary.machine_stock_rows = len(stock_params)
+
+    if dry_run:
+        await session.rollback()
+        return summary
+    await session.commit()
+    summary.catalog_version = version
+    # Pick up this import (products and watched machines) right away; other workers do on their next check
+    await catalog_sync.check()
+    return summary
+
+
+async def import_catalog(plan: ImportPlan, dry_run: bool = False) -> CatalogImportSummary:
+    """Apply one validated import in its own session"""
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        return await apply_import(session, plan, dry_run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create, update and restock products from a CSV, JSON or NDJSON file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="default: from the file extension")
+    parser.add_argument("--mode", choices=IMPORT_MODES, default="add", help="add to the stock, or set it")
+    parser.add_argument("--dry-run", action="store_true", help="validate and report the changes without writing")
+    args = parser.parse_args()
+    fmt = args.format or args.path.rsplit(".", 1)[-1].lower()
+    if fmt not in IMPORT_FORMATS:
+        parser.error("pass --format csv, json or ndjson")
+    ensure_catalog_version()
+    with open(args.path, newline="", encoding="utf-8-sig") as source:
+        plan = build_plan(iter(lambda: source.read(READ_CHUNK_CHARS), ""), fmt, args.mode)
+    try:
+        result = asyncio.run(import_catalog(plan, args.dry_run))
+    except CatalogImportInvalid as e:
+        print(f"❌ {e}")
+        for error in e.errors:
+            print(f"  line {error.line}: {error.message}")
+        raise SystemExit(1)
+    print(result.model_dump_json(indent=2))
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.catalog import catalog
+from app.config import settings
+from app.database import async_read_engine, engine
+from app.inventory_feed import inventory_feed
+from app.metrics import registry
+from app.models import CatalogVersion, Machine, MachineStock, Product
+
+logger = logging.getLogger(__name__)
+
+# Machine ids per IN list, well under SQLite's bound parameter limit
+WATCHED_CHUNK = 500
+
+
+def ensure_catalog_version():
+    """Create the catalog version row if this database does not have one yet"""
+    with Session(engine) as session:
+        if session.get(CatalogVersion, 1) is not None:
+            return
+        session.add(CatalogVersion(id=1, version=0))
+        try:
+            session.commit()
+        except IntegrityError:
+            # Another worker created it first
+            session.rollback()
+
+
+def bump_statement():
+    """Next catalog version; the row lock it takes orders product writes across workers"""
+    return (
+        update(CatalogVersion)
+        .where(CatalogVersion.id == 1)
+        .values(version=CatalogVersion.version + 1, updated_at=datetime.utcnow())
+        .returning(CatalogVersion.version)
+    )
+
+
+async def bump_version(session: AsyncSession) -> int:
+    """Take the next catalog version inside the caller's transaction; stamp it on every product written"""
+    return (await session.exec(bump_statement())).scalar_one()
+
+
+def bump_version_sync(session: Session) -> int:
+    return session.exec(bump_statement()).scalar_one()
+
+
+class CatalogSync:
+    """Keeps this worker's catalog and machine feeds in step with writes committed by other workers"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.seen = 0
+        self.checks = 0
+        self.reloads = 0
+        self.products_reloaded = 0
+        self.machine_rows_reloaded = 0
+        # Stock version last published per watched machine
+        self._machine_versions: Dict[int, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    async def load(self, session: AsyncSession):
+        """Load the whole catalog and remember the version it reflects"""
+        # Version first: a write committed in between is reloaded by the next check
+        self.seen = (await session.exec(select(CatalogVersion.version).where(CatalogVersion.id == 1))).one_or_none() or 0
+        await catalog.refresh(session)
+
+    async def check(self) -> int:
+        """Reload the products and watched machine stock written since the last check; returns how many rows"""
+        self.checks += 1
+        async with AsyncSession(async_read_engine) as session:
+            products = await self._changed_products(session)
+            levels = await self._changed_machine_stock(session)
+        return len(products) + len(levels)
+
+    async def _changed_products(self, session: AsyncSession) -> List:
+        # Version first: the product rows read after it are at least that new, and a write
+        # committed in between is read again by the next check
+        version = (await session.exec(select(CatalogVersion.version).where(CatalogVersion.id == 1))).one_or_none()
+        if version is None or version <= self.seen:
+            return []
+        # Only what the catalog keeps; whole ORM rows cost several times more after a bulk import
+        products = (await session.exec(
+            select(Product.id, Product.name, Product.price, Product.stock).where(Product.version > self.seen)
+        )).all()
+        if products:
+            catalog.upsert_many(products)
+        self.seen = version
+        self.reloads += 1
+        self.products_reloaded += len(products)
+        return products
+
+    async def _changed_machine_stock(self, session: AsyncSession) -> List:
+        # Machine stock only matters to feed subscribers; a new one starts from a snapshot
+        watched = inventory_feed.watched_machines()
+        self._machine_versions = {machine_id: self._machine_versions.get(machine_id) for machine_id in watched}
+        if not watched:
+            return []
+        versions: Dict[int, int] = {}
+        for start in range(0, len(watched), WATCHED_CHUNK):
+            versions.update((await session.exec(
+                select(Machine.id, Machine.stock_version).where(Machine.id.in_(watched[start:start + WATCHED_CHUNK]))
+            )).all())
+        changed = [machine_id for machine_id, version in versions.items() if version != self._machine_versions.get(machine_id)]
+        if not changed:
+            return []
+        # Read after the versions, so the levels are at least as new as the versions remembered
+        levels = []
+        for start in range(0, len(changed), WATCHED_CHUNK):
+            levels.extend((await session.exec(
+                select(MachineStock.machine_id, MachineStock.product_id, MachineStock.stock)
+                .where(MachineStock.machine_id.in_(changed[start:start + WATCHED_CHUNK]))
+            )).all())
+        by_machine: Dict[int, Dict[int, int]] = {machine_id: {} for machine_id in changed}
+        for machine_id, product_id, stock in levels:
+            by_machine[machine_id][product_id] = stock
+        for machine_id, stock in by_machine.items():
+            # The channel drops levels it already published, including this worker's own writes
+            inventory_feed.stock_changed(machine_id, stock)
+            self._machine_versions[machine_id] = versions[machine_id]
+        self.machine_rows_reloaded += len(levels)
+        return levels
+
+    def start(self):
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Catalog version check failed")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "seen_version": self.seen,
+            "checks": self.checks,
+            "reloads": self.reloads,
+            "products_reloaded": self.products_reloaded,
+            "machine_rows_reloaded": self.machine_rows_reloaded,
+        }
+
+
+catalog_sync = CatalogSync(settings.catalog_sync_interval_ms / 1000)
+registry.gauge(
+    "soda_catalog_sync", "Catalog version last seen by this worker and reloads of products written elsewhere", ["stat"],
+    lambda: {(stat,): value for stat, value in catalog_sync.stats().items()}
+)
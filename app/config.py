@@ -11,6 +11,8 @@ class Settings(BaseSettings):
     
     # Database Configuration
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./soda_vending.db")
+    db_profile: str = os.getenv("DB_PROFILE", "development")  # legacy, development or production
+    db_echo: bool = os.getenv("DB_ECHO", "false").lower() == "true"  # Log every SQL statement
     
     # API Configuration
     api_host: str = os.getenv("API_HOST", "0.0.0.0")
@@ -22,6 +24,57 @@ class Settings(BaseSettings):
     openai_base_url: str = os.getenv("OPENAI_BASE_URL", "http://localhost:11434/v1")
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
     
+    # LLM Call Budget (0 disables the timeout, the concurrency cap or the breaker)
+    llm_timeout: float = float(os.getenv("LLM_TIMEOUT", "10"))  # Seconds per parse, slot wait and retries included
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+    llm_breaker_failures: int = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # Consecutive failures that open the breaker
+    llm_breaker_reset: float = float(os.getenv("LLM_BREAKER_RESET", "30"))  # Seconds open before a probe call
+    
+    # Intent Parsing: "ai" sends every message to the LLM, "cascade" tries the local parser first
+    parse_mode: str = os.getenv("PARSE_MODE", "ai")
+    cascade_confidence_threshold: float = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", "0.7"))
+    
+    # Micro-batching of concurrent LLM parses (max size 1 disables it)
+    parse_batch_max_size: int = int(os.getenv("PARSE_BATCH_MAX_SIZE", "1"))
+    parse_batch_max_wait_ms: float = float(os.getenv("PARSE_BATCH_MAX_WAIT_MS", "5"))
+    
+    # Intent Parse Cache (size 0 disables the cache)
+    intent_cache_size: int = int(os.getenv("INTENT_CACHE_SIZE", "1024"))
+    intent_cache_ttl: float = float(os.getenv("INTENT_CACHE_TTL", "300"))
+    
+    # Group commit of purchases: concurrent sales within the wait window share one write
+    # transaction of up to max size sales (max size 1 commits every sale on its own)
+    group_commit_max_size: int = int(os.getenv("GROUP_COMMIT_MAX_SIZE", "1"))
+    group_commit_max_wait_ms: float = float(os.getenv("GROUP_COMMIT_MAX_WAIT_MS", "2"))
+    
+    # Ledger archival (python -m app.archive): rows older than ARCHIVE_AFTER_DAYS move to
+    # monthly archive tables in batches, pausing between batches so writers get the lock
+    archive_after_days: float = float(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+    archive_batch_size: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "2000"))
+    archive_batch_pause_ms: float = float(os.getenv("ARCHIVE_BATCH_PAUSE_MS", "50"))
+    
+    # Cross-worker catalog coherence: how often each worker compares the catalog version row
+    # with the version it has loaded and reloads the products written since (0 disables it)
+    catalog_sync_interval_ms: float = float(os.getenv("CATALOG_SYNC_INTERVAL_MS", "250"))
+    
+    # Bulk catalog import (POST /catalog/import, python -m app.catalog_import): rows per upsert
+    # statement, all in one transaction, and the largest request body accepted
+    catalog_import_chunk_size: int = int(os.getenv("CATALOG_IMPORT_CHUNK_SIZE", "500"))
+    catalog_import_max_bytes: int = int(os.getenv("CATALOG_IMPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+    
+    # Inventory change feed (SSE): change events kept per channel for Last-Event-ID resume; a
+    # subscriber further behind than that gets a fresh snapshot instead of the missed deltas
+    inventory_feed_history: int = int(os.getenv("INVENTORY_FEED_HISTORY", "1024"))
+    inventory_feed_heartbeat: float = float(os.getenv("INVENTORY_FEED_HEARTBEAT", "15"))  # Seconds between keepalives
+    
+    # Idempotency-Key replay cache for purchases (size 0 disables it)
+    idempotency_cache_size: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+    idempotency_ttl: float = float(os.getenv("IDEMPOTENCY_TTL", "3600"))  # Seconds a completed response is replayed
+    
+    # Startup: "eager" builds the LLM client at import, "lazy" on the first parse that needs it
+    startup_mode: str = os.getenv("STARTUP_MODE", "eager")
+    
     # Application Configuration
     app_title: str = os.getenv("APP_TITLE", "Soda Vending Machine API")
     app_description: str = os.getenv("APP_DESCRIPTION", "AI-powered soda vending machine with natural language processing")
@@ -1,23 +1,176 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
 from sqlmodel import SQLModel, create_engine, Session
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import event, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine
 from app.config import settings
+from app.metrics import registry
+
+
+@dataclass(frozen=True)
+class EngineProfile:
+    """SQLite pragmas and pool sizing applied to every engine"""
+    journal_mode: Optional[str] = "WAL"
+    synchronous: Optional[str] = "NORMAL"
+    busy_timeout_ms: int = 30000
+    cache_size_kib: Optional[int] = None
+    mmap_size: Optional[int] = None
+    pool_size: int = 5
+    max_overflow: int = 10
+    read_pool_size: int = 5
+    read_max_overflow: int = 10
+
+
+ENGINE_PROFILES: Dict[str, EngineProfile] = {
+    # Driver defaults: rollback journal, FULL sync, 5s busy wait
+    "legacy": EngineProfile(journal_mode=None, synchronous=None, busy_timeout_ms=5000),
+    "development": EngineProfile(),
+    "production": EngineProfile(
+        cache_size_kib=64 * 1024,
+        mmap_size=256 * 1024 * 1024,
+        pool_size=10,
+        max_overflow=20,
+        read_pool_size=20,
+        read_max_overflow=40,
+    ),
+}
+
+
+def _async_database_url(url: str) -> str:
+    """Map a sync database URL onto its asyncio driver"""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+def get_engine_profile(name: str) -> EngineProfile:
+    """Look up a named engine profile"""
+    try:
+        return ENGINE_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown DB_PROFILE '{name}'. Choose one of: {', '.join(ENGINE_PROFILES)}") from None
+
+
+def _install_sqlite_pragmas(sync_engine, profile: EngineProfile, read_only: bool = False):
+    """Run the profile's PRAGMAs on every new SQLite connection"""
+    pragmas = [f"busy_timeout = {profile.busy_timeout_ms}"]
+    if profile.journal_mode:
+        pragmas.append(f"journal_mode = {profile.journal_mode}")
+    if profile.synchronous:
+        pragmas.append(f"synchronous = {profile.synchronous}")
+    if profile.cache_size_kib:
+        pragmas.append(f"cache_size = -{profile.cache_size_kib}")
+    if profile.mmap_size:
+        pragmas.append(f"mmap_size = {profile.mmap_size}")
+    if read_only:
+        pragmas.append("query_only = ON")
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+def _engine_options(url: str, pool_size: int, max_overflow: int) -> Dict[str, Any]:
+    options: Dict[str, Any] = {"echo": settings.db_echo}
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+        if ":memory:" in url:
+            return options
+    options["pool_size"] = pool_size
+    options["max_overflow"] = max_overflow
+    return options
 
-engine = create_engine(
-    settings.database_url,
-    echo=settings.debug,  # Set to False in production
-    connect_args={"check_same_thread": False}
-)
+
+def _build_engines(url: str, profile: EngineProfile):
+    async_url = _async_database_url(url)
+    sync_engine = create_engine(url, **_engine_options(url, profile.pool_size, profile.max_overflow))
+    write_engine = create_async_engine(
+        async_url, **_engine_options(async_url, profile.pool_size, profile.max_overflow)
+    )
+    # Separate pool for GET endpoints so reads never wait behind purchase writers for a connection
+    read_engine = create_async_engine(
+        async_url, **_engine_options(async_url, profile.read_pool_size, profile.read_max_overflow)
+    )
+    if url.startswith("sqlite"):
+        _install_sqlite_pragmas(sync_engine, profile)
+        _install_sqlite_pragmas(write_engine.sync_engine, profile)
+        _install_sqlite_pragmas(read_engine.sync_engine, profile, read_only=True)
+    return sync_engine, write_engine, read_engine
+
+
+engine_profile = get_engine_profile(settings.db_profile)
+engine, async_engine, async_read_engine = _build_engines(settings.database_url, engine_profile)
+
+
+def _pool_stats():
+    """Connection pool usage per async engine, for the /metrics gauges"""
+    stats = {}
+    for name, pool_engine in (("write", async_engine), ("read", async_read_engine)):
+        pool = pool_engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        stats[(name, "size")] = pool.size()
+        stats[(name, "checkedout")] = pool.checkedout()
+        stats[(name, "checkedin")] = pool.checkedin()
+        # QueuePool reports unused overflow capacity as a negative number
+        stats[(name, "overflow")] = max(pool.overflow(), 0)
+    return stats
+
+
+registry.gauge("soda_db_pool_connections", "Database connection pool usage", ["engine", "stat"], _pool_stats)
+
+def _add_missing_columns():
+    """Add nullable columns that were introduced after a table was first created"""
+    existing_tables = set(inspect(engine).get_table_names())
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column["name"] for column in inspect(connection).get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+
+_DIALECT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+def dialect_insert(dialect_name: str, table):
+    """INSERT for the session's dialect, which is where on_conflict_do_update lives"""
+    return _DIALECT_INSERTS[dialect_name](table)
 
 def create_db_and_tables():
     """Create database and tables"""
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    # create_all skips indexes on tables that already exist
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 def get_session():
     """Get database session"""
     with Session(engine) as session:
         yield session
 
+async def get_async_session():
+    """Get async database session for request handlers"""
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+async def get_async_read_session():
+    """Get read-only async database session for GET handlers"""
+    async with AsyncSession(async_read_engine, expire_on_commit=False) as session:
+        yield session
+
 async def init_db():
     """Initialize database on startup"""
-    create_db_and_tables() 
\ No newline at end of file
+    create_db_and_tables()
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlmodel import select, tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.archive import archive_table, archived_tables
+from app.database import async_read_engine
+from app.models import Transaction
+
+# New columns go at the end so positional CSV consumers keep working
+EXPORT_COLUMNS = ["id", "product_id", "quantity", "total_amount", "payment_method", "status", "created_at", "machine_id"]
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _export_statement(since: Optional[datetime], since_id: Optional[int], machine_id: Optional[int] = None,
+                      columns=Transaction):
+    """Export query on the hot ledger, or on an archive table when given its .c"""
+    statement = select(*[getattr(columns, column) for column in EXPORT_COLUMNS])
+    if machine_id is not None:
+        statement = statement.where(columns.machine_id == machine_id)
+    if since is not None:
+        if since_id is not None:
+            statement = statement.where(tuple_(columns.created_at, columns.id) > (since, since_id))
+        else:
+            statement = statement.where(columns.created_at > since)
+    return statement.order_by(columns.created_at, columns.id)
+
+
+def _ndjson_batch(rows) -> str:
+    return "".join(
+        json.dumps({**row._asdict(), "created_at": row.created_at.isoformat()}) + "\n"
+        for row in rows
+    )
+
+
+def _csv_batch(rows, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(tuple(value.isoformat() if isinstance(value, datetime) else value for value in row) for row in rows)
+    return buffer.getvalue()
+
+
+async def stream_transactions(
+    export_format: str,
+    since: Optional[datetime] = None,
+    since_id: Optional[int] = None,
+    batch_size: int = 1000,
+    machine_id: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """Stream the ledger oldest-first in fixed-size batches, holding one batch in memory at a time"""
+    # The session lives inside the generator so it stays open for the whole response body
+    async with AsyncSession(async_read_engine) as session:
+        # Archived months first, oldest first, then the hot table: together one ordered ledger
+        statements = [
+            _export_statement(since, since_id, machine_id, archive_table(entry.table_name).c)
+            for entry in await archived_tables(session, since)
+        ]
+        statements.append(_export_statement(since, since_id, machine_id))
+        first = True
+        for statement in statements:
+            result = await session.stream(statement.execution_options(yield_per=batch_size))
+            async for rows in result.partitions(batch_size):
+                if export_format == "csv":
+                    yield _csv_batch(rows, header=first)
+                else:
+                    yield _ndjson_batch(rows)
+                first = False
+        if first and export_format == "csv":
+            yield _csv_batch([], header=True)
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from sqlmodel import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.catalog_sync import bump_version
+from app.config import settings
+from app.database import async_engine
+from app.machines import bump_stock_versions, decrement_statement
+from app.metrics import GROUP_COMMIT_BATCH_SIZE
+from app.models import Transaction
+from app.rollups import record_sales
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Sale:
+    product_id: int
+    quantity: int
+    total_amount: float
+    machine_id: Optional[int]
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    future: Optional[asyncio.Future] = None
+    remaining_stock: Optional[int] = None
+
+
+class GroupCommitLedger:
+    """Commits the sales of concurrent purchases together, one write transaction per batch"""
+
+    def __init__(self, max_size: int, max_wait: float):
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.batches = 0
+        # Created on first use so they bind to the serving event loop (Python < 3.10)
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 1
+
+    async def sell(self, product_id: int, quantity: int, total_amount: float, machine_id: Optional[int] = None) -> Optional[int]:
+        """Remaining stock once the batch holding this sale has committed, or None if the stock was short"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._run())
+        sale = _Sale(product_id, quantity, total_amount, machine_id)
+        sale.future = asyncio.get_running_loop().create_future()
+        await self._queue.put(sale)
+        return await sale.future
+
+    async def _next_batch(self) -> List[_Sale]:
+        """Sales queued within max_wait of the first one, up to max_size; a None entry means stop"""
+        batch = []
+        deadline = None
+        while len(batch) < self.max_size:
+            if deadline is None:
+                sale = await self._queue.get()
+                deadline = time.monotonic() + self.max_wait
+            elif not self._queue.empty():
+                sale = self._queue.get_nowait()
+            else:
+                try:
+                    sale = await asyncio.wait_for(self._queue.get(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    break
+            if sale is None:
+                self._stopping = True
+                break
+            batch.append(sale)
+        return batch
+
+    async def _run(self):
+        while not self._stopping:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            try:
+                await self._commit(batch)
+            except Exception as e:
+                logger.exception("Group commit of %d sales failed", len(batch))
+                for sale in batch:
+                    if not sale.future.done():
+                        sale.future.set_exception(e)
+                continue
+            for sale in batch:
+                if not sale.future.done():
+                    sale.future.set_result(sale.remaining_stock)
+
+    async def _commit(self, batch: List[_Sale]):
+        # Every decrement is still the guarded single statement, in queue order; the ledger
+        # rows of the sales that went through follow as one executemany. Nobody is answered
+        # before the commit, and a failed commit leaves nothing of the batch applied
+        async with AsyncSession(async_engine) as session:
+            # One catalog version for every Product row the batch writes; machine sales skip the shared row
+            version = await bump_version(session) if any(sale.machine_id is None for sale in batch) else None
+            for sale in batch:
+                result = await session.exec(
+                    decrement_statement(sale.product_id, sale.quantity, sale.machine_id, sale.created_at, version)
+                )
+                sale.remaining_stock = result.scalar_one_or_none()
+            sold = [sale for sale in batch if sale.remaining_stock is not None]
+            await bump_stock_versions(session, [sale.machine_id for sale in sold if sale.machine_id is not None])
+            if sold:
+                await session.exec(insert(Transaction), params=[
+                    {
+                        "product_id": sale.product_id,
+                        "machine_id": sale.machine_id,
+                        "quantity": sale.quantity,
+                        "total_amount": sale.total_amount,
+                        "payment_method": "cash",
+                        "status": "completed",
+                        "created_at": sale.created_at,
+                    }
+                    for sale in sold
+                ])
+                await record_sales(session, [
+                    (sale.product_id, sale.quantity, sale.total_amount, sale.created_at) for sale in sold
+                ])
+            await session.commit()
+        self.batches += 1
+        GROUP_COMMIT_BATCH_SIZE.observe(len(batch))
+
+    async def close(self):
+        """Commit everything queued so far, then stop the writer"""
+        if self._writer is None or self._writer.done():
+            return
+        await self._queue.put(None)
+        await self._writer
+        self._writer = None
+        self._stopping = False
+
+
+ledger = GroupCommitLedger(settings.group_commit_max_size, settings.group_commit_max_wait_ms / 1000)
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from app.config import settings
+from app.metrics import IDEMPOTENT_REQUESTS, registry
+
+T = TypeVar("T")
+
+
+class IdempotencyKeyReused(Exception):
+    """The same Idempotency-Key arrived with a different request"""
+
+
+class IdempotencyStore:
+    """Bounded LRU of completed responses per Idempotency-Key, plus the requests still running"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._completed: "OrderedDict[str, Tuple[float, Hashable, object]]" = OrderedDict()
+        self._in_flight: Dict[str, Tuple[Hashable, asyncio.Future]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def _lookup(self, key: str, fingerprint: Hashable) -> Optional[object]:
+        entry = self._completed.get(key)
+        if entry is None:
+            return None
+        expires_at, stored_fingerprint, response = entry
+        if expires_at < time.monotonic():
+            del self._completed[key]
+            return None
+        if stored_fingerprint != fingerprint:
+            raise IdempotencyKeyReused(f"Idempotency-Key '{key}' was already used for a different request")
+        self._completed.move_to_end(key)
+        return response
+
+    def _store(self, key: str, fingerprint: Hashable, response: object):
+        self._completed[key] = (time.monotonic() + self.ttl, fingerprint, response)
+        self._completed.move_to_end(key)
+        while len(self._completed) > self.maxsize:
+            self._completed.popitem(last=False)
+
+    async def run(self, key: Optional[str], fingerprint: Hashable, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Run call once per key; returns (response, replayed). Exceptions are not stored, so a retry runs again"""
+        if key is None or not self.enabled:
+            return await call(), False
+        stored = self._lookup(key, fingerprint)
+        if stored is not None:
+            IDEMPOTENT_REQUESTS.inc(outcome="replayed")
+            return stored, True
+        running = self._in_flight.get(key)
+        if running is not None:
+            running_fingerprint, future = running
+            if running_fingerprint != fingerprint:
+                raise IdempotencyKeyReused(f"Idempotency-Key '{key}' is in use by a different request")
+            IDEMPOTENT_REQUESTS.inc(outcome="joined")
+            # Shielded so a follower that goes away does not cancel the shared result
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, future)
+        try:
+            response = await call()
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("original request was cancelled"))
+            # Mark the exception retrieved even when nobody joined
+            future.exception()
+            raise
+        else:
+            self._store(key, fingerprint, response)
+            future.set_result(response)
+            IDEMPOTENT_REQUESTS.inc(outcome="stored")
+            return response, False
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> Dict[str, float]:
+        return {"size": len(self._completed), "maxsize": self.maxsize, "ttl_seconds": self.ttl, "in_flight": len(self._in_flight)}
+
+
+idempotent_purchases = IdempotencyStore(settings.idempotency_cache_size, settings.idempotency_ttl)
+registry.gauge(
+    "soda_idempotency_keys", "Idempotency keys with a stored response (size) or a request in flight", ["stat"],
+    lambda: {(stat,): idempotent_purchases.stats()[stat] for stat in ("size", "in_flight")}
+)
@@ -0,0 +1,95 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.ai_parser import PurchaseIntent
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = ".,!?;:\"' "
+
+
+def normalize_message(message: str) -> str:
+    """Canonical form of a message for cache lookups"""
+    return _WHITESPACE.sub(" ", message.lower()).strip(_EDGE_PUNCTUATION)
+
+
+_last_fingerprint: Tuple[Optional[tuple], int] = (None, 0)
+
+
+def catalog_fingerprint(available_products: Sequence[str]) -> int:
+    """Order-independent fingerprint of the product list"""
+    global _last_fingerprint
+    products, fingerprint = _last_fingerprint
+    if available_products is products:
+        return fingerprint
+    fingerprint = hash(frozenset(available_products))
+    # Only immutable lists (the catalog hands out tuples) are safe to memoize by identity
+    if isinstance(available_products, tuple):
+        _last_fingerprint = (available_products, fingerprint)
+    return fingerprint
+
+
+class IntentCache:
+    """Bounded LRU cache with TTL for parsed purchase intents"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, PurchaseIntent]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    @staticmethod
+    def key(message: str, available_products: Sequence[str]) -> Tuple[str, int]:
+        """Cache key: normalized message plus catalog fingerprint"""
+        return normalize_message(message), catalog_fingerprint(available_products)
+
+    def get(self, key: Hashable) -> Optional["PurchaseIntent"]:
+        """Return a copy of the cached intent, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, intent = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return intent.model_copy()
+
+    def put(self, key: Hashable, intent: "PurchaseIntent"):
+        """Store an intent, evicting the least recently used entry when full"""
+        if not self.enabled:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, intent.model_copy())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
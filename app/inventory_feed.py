@@ -0,0 +1,212 @@
+import asyncio
+import json
+import uuid
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.catalog import CatalogChange, catalog
+from app.config import settings
+from app.database import async_read_engine
+from app.inventory_snapshot import current_inventory, serialize_products
+from app.machines import machine_inventory
+from app.metrics import registry
+
+# Reconnect delay suggested to EventSource clients
+RETRY_MS = 3000
+
+
+class _Channel:
+    """Change log of one inventory view: the global stock (machine_id None) or one machine's"""
+
+    def __init__(self, machine_id: Optional[int], history: int, start: int = 0):
+        self.machine_id = machine_id
+        # Positions before start belong to an earlier channel of the same view and cannot be resumed
+        self.start = start
+        self.seq = start
+        self.subscribers = 0
+        self._log: Deque[Tuple[int, List[CatalogChange]]] = deque(maxlen=history)
+        self._changed: Optional[asyncio.Future] = None
+        # (cursor, seq, encoded delta): subscribers that were caught up all ask for the same one
+        self._last_delta: Optional[Tuple[int, int, str]] = None
+        # Last stock published per product id, so the same level reported twice is one event
+        self.levels: Dict[int, int] = {}
+
+    def append(self, changes: List[CatalogChange]):
+        self.seq += 1
+        self._log.append((self.seq, changes))
+        if self._changed is not None:
+            # One future per channel wakes every waiting subscriber, however many there are
+            if not self._changed.done():
+                self._changed.set_result(None)
+            self._changed = None
+
+    def changed(self) -> asyncio.Future:
+        if self._changed is None:
+            self._changed = asyncio.get_running_loop().create_future()
+        return self._changed
+
+    def since(self, cursor: int) -> Optional[List[CatalogChange]]:
+        """Changes after cursor, latest value per product, or None if they are no longer all in the log"""
+        missed = self.seq - cursor
+        if missed > len(self._log):
+            return None
+        merged: Dict[object, CatalogChange] = {}
+        # Read from the right end, so the cost follows what was missed rather than the log size
+        for index in range(missed, 0, -1):
+            for change in self._log[-index][1]:
+                merged.setdefault(change["id"], {}).update(change)
+        return list(merged.values())
+
+    def delta(self, cursor: int) -> Optional[str]:
+        """JSON body of the delta event from cursor to the current seq, encoded once per position"""
+        cached = self._last_delta
+        if cached is not None and cached[0] == cursor and cached[1] == self.seq:
+            return cached[2]
+        changes = self.since(cursor)
+        if changes is None:
+            return None
+        body = json.dumps({"products": changes})
+        self._last_delta = (cursor, self.seq, body)
+        return body
+
+
+class InventoryFeed:
+    """Inventory change events for server-sent event subscribers, one log per channel"""
+
+    def __init__(self, history: int = 1024, heartbeat: float = 15.0):
+        self.history = history
+        self.heartbeat = heartbeat
+        # Event ids carry the process, so an id from another worker or a restart forces a snapshot
+        self._instance = uuid.uuid4().hex[:8]
+        self._channels: Dict[Optional[int], _Channel] = {None: _Channel(None, history)}
+        # Highest seq any dropped channel reached; a new channel starts past it
+        self._dropped_seq = 0
+        self.subscribers = 0
+        self.snapshots = 0
+        self.resumes = 0
+        self.resyncs = 0
+
+    def _channel(self, machine_id: Optional[int]) -> _Channel:
+        channel = self._channels.get(machine_id)
+        if channel is None:
+            channel = self._channels[machine_id] = _Channel(machine_id, self.history, self._dropped_seq + 1)
+        return channel
+
+    def _release(self, channel: _Channel):
+        """A subscriber left; a machine channel nobody listens to is dropped with its log"""
+        channel.subscribers -= 1
+        if channel.subscribers or channel.machine_id is None or self._channels.get(channel.machine_id) is not channel:
+            return
+        del self._channels[channel.machine_id]
+        self._dropped_seq = max(self._dropped_seq, channel.seq)
+
+    def catalog_changed(self, changes: List[CatalogChange]):
+        """Catalog listener: global stock and product changes after commit"""
+        self._channels[None].append(changes)
+        # Machines keep their own stock; only name and price changes apply to them
+        product_changes = [{k: v for k, v in change.items() if k != "stock"} for change in changes]
+        product_changes = [change for change in product_changes if len(change) > 1]
+        if product_changes:
+            for machine_id, channel in self._channels.items():
+                if machine_id is not None:
+                    channel.append(product_changes)
+
+    def stock_changed(self, machine_id: int, stock: Dict[int, int]):
+        """Publish one machine's committed stock levels per product id"""
+        channel = self._channels.get(machine_id)
+        # No channel means nobody ever subscribed; a first subscriber starts from a snapshot anyway
+        if channel is None:
+            return
+        # The writing worker publishes right after its commit and again when its version check sees the row
+        changes = [{"id": product_id, "stock": level} for product_id, level in stock.items() if channel.levels.get(product_id) != level]
+        channel.levels.update(stock)
+        if changes:
+            channel.append(changes)
+
+    def watched_machines(self) -> List[int]:
+        """Machines with a channel, i.e. with at least one subscriber waiting for their stock changes"""
+        return [machine_id for machine_id in self._channels if machine_id is not None]
+
+    def _event_id(self, channel: _Channel, seq: int) -> str:
+        return f"{self._instance}.{channel.machine_id or 0}.{seq}"
+
+    def _resume_point(self, channel: _Channel, last_event_id: Optional[str]) -> Optional[int]:
+        parts = (last_event_id or "").split(".")
+        if len(parts) != 3 or parts[0] != self._instance or parts[1] != str(channel.machine_id or 0):
+            return None
+        try:
+            seq = int(parts[2])
+        except ValueError:
+            return None
+        if seq < channel.start or seq > channel.seq or channel.since(seq) is None:
+            return None
+        return seq
+
+    async def _snapshot(self, channel: _Channel) -> Tuple[int, bytes]:
+        # Read the position first: deltas carry absolute values, so replaying one the
+        # snapshot already includes is harmless, while skipping one would not be
+        seq = channel.seq
+        if channel.machine_id is None:
+            body = (await current_inventory()).body
+        else:
+            async with AsyncSession(async_read_engine) as session:
+                body, _ = serialize_products(await machine_inventory(session, channel.machine_id))
+        self.snapshots += 1
+        return seq, body
+
+    async def events(self, machine_id: Optional[int], last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Server-sent events: a snapshot (or the deltas missed since last_event_id), then deltas as they commit"""
+        channel = self._channel(machine_id)
+        channel.subscribers += 1
+        self.subscribers += 1
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            cursor = self._resume_point(channel, last_event_id)
+            if cursor is None:
+                cursor, body = await self._snapshot(channel)
+                yield _format(self._event_id(channel, cursor), "snapshot", body.decode())
+            else:
+                self.resumes += 1
+            while True:
+                if channel.seq == cursor:
+                    try:
+                        await asyncio.wait_for(asyncio.shield(channel.changed()), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                    continue
+                body = channel.delta(cursor)
+                if body is None:
+                    # Backpressure: a subscriber that fell behind the log gets the current state
+                    # instead of an ever-growing backlog of deltas
+                    self.resyncs += 1
+                    cursor, body = await self._snapshot(channel)
+                    yield _format(self._event_id(channel, cursor), "snapshot", body.decode())
+                    continue
+                cursor = channel.seq
+                yield _format(self._event_id(channel, cursor), "delta", body)
+        finally:
+            self.subscribers -= 1
+            self._release(channel)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "subscribers": self.subscribers,
+            "channels": len(self._channels),
+            "snapshots": self.snapshots,
+            "resumes": self.resumes,
+            "resyncs": self.resyncs,
+        }
+
+
+def _format(event_id: str, event: str, data: str) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+inventory_feed = InventoryFeed(settings.inventory_feed_history, settings.inventory_feed_heartbeat)
+catalog.add_listener(inventory_feed.catalog_changed)
+registry.gauge(
+    "soda_inventory_feed", "Inventory change feed subscribers, channels and snapshot/resume/resync counts", ["stat"],
+    lambda: {(stat,): value for stat, value in inventory_feed.stats().items()}
+)
@@ -0,0 +1,82 @@
+import hashlib
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from pydantic import TypeAdapter
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.catalog import catalog
+from app.database import async_read_engine
+from app.models import Product
+
+_products_adapter = TypeAdapter(List[Product])
+# Internal bookkeeping: a bulk import moves the catalog version even where nothing a client sees changed
+_PRIVATE_FIELDS = {"__all__": {"version"}}
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Serialized inventory as of one catalog version"""
+    version: int
+    body: bytes
+    etag: str
+
+
+def serialize_products(products: Sequence[Product]) -> Tuple[bytes, str]:
+    """JSON body and ETag for a list of products"""
+    body = _products_adapter.dump_json(list(products), exclude=_PRIVATE_FIELDS)
+    # Content-derived, so every worker serving the same rows hands out the same ETag
+    return body, '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+class InventorySnapshot:
+    """Pre-serialized /inventory body, rebuilt only when the catalog version moves"""
+
+    def __init__(self):
+        self._snapshot: Optional[Snapshot] = None
+
+    def current(self, version: int) -> Optional[Snapshot]:
+        """The cached snapshot if it is still at this catalog version"""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        return None
+
+    def build(self, version: int, products: Sequence[Product]) -> Snapshot:
+        """Serialize products once and stamp them with the catalog version read before the query"""
+        body, etag = serialize_products(products)
+        snapshot = Snapshot(version=version, body=body, etag=etag)
+        self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+inventory_snapshot = InventorySnapshot()
+
+
+async def current_inventory() -> Snapshot:
+    """The global /inventory snapshot at the current catalog version"""
+    version = catalog.version
+    snapshot = inventory_snapshot.current(version)
+    if snapshot is None:
+        # Only a changed catalog reaches the database; unchanged polls are served from memory
+        async with AsyncSession(async_read_engine) as session:
+            products = (await session.exec(select(Product))).all()
+        snapshot = inventory_snapshot.build(version, products)
+    return snapshot
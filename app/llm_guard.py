@@ -0,0 +1,99 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+BREAKER_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Stops calling a failing upstream after a run of failures and probes it again later"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream; while half-open only one probe is let through"""
+        if not self.enabled or self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or (self.enabled and self.consecutive_failures >= self.failure_threshold):
+            if self.state != OPEN:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def record_abandoned(self):
+        """A call that ended without telling us anything about the upstream (e.g. cancelled)"""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout_seconds": self.reset_timeout,
+            "open_for_seconds": round(time.monotonic() - self.opened_at, 3) if self.state != CLOSED and self.opened_at else 0.0,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+class ConcurrencyLimit:
+    """Caps concurrent upstream calls; a limit of 0 means unlimited"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        # Created on first use so it binds to the serving event loop (Python < 3.10)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self):
+        if self.limit <= 0:
+            self.in_flight += 1
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"limit": self.limit, "in_flight": self.in_flight, "waiting": self.waiting}
@@ -0,0 +1,123 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import bindparam, func
+from sqlmodel import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import dialect_insert
+from app.models import Machine, MachineStock, Product
+
+
+class MachineDirectory:
+    """Ids of machines known to exist, so machine-scoped requests skip the lookup after the first hit"""
+
+    def __init__(self):
+        self._known: Set[int] = set()
+
+    async def exists(self, session: AsyncSession, machine_id: int) -> bool:
+        if machine_id in self._known:
+            return True
+        # Machines are never deleted, so a positive answer can be kept for the life of the process
+        if (await session.exec(select(Machine.id).where(Machine.id == machine_id))).first() is None:
+            return False
+        self._known.add(machine_id)
+        return True
+
+    def add(self, machine_id: int):
+        self._known.add(machine_id)
+
+
+async def machine_stock(session: AsyncSession, machine_id: int, product_ids: Iterable[int]) -> Dict[int, int]:
+    """Current stock per product in one machine; products it does not carry are 0"""
+    product_ids = list(product_ids)
+    rows = (await session.exec(
+        select(MachineStock.product_id, MachineStock.stock)
+        .where(MachineStock.machine_id == machine_id, MachineStock.product_id.in_(product_ids))
+    )).all()
+    stock = dict.fromkeys(product_ids, 0)
+    stock.update(dict(rows))
+    return stock
+
+
+async def machine_inventory(session: AsyncSession, machine_id: int) -> List[Product]:
+    """Products carried by one machine, shaped like /inventory with the machine's own stock"""
+    rows = (await session.exec(
+        select(Product, MachineStock.stock)
+        .join(MachineStock, MachineStock.product_id == Product.id)
+        .where(MachineStock.machine_id == machine_id)
+        .order_by(Product.id)
+    )).all()
+    # Detached copies, so the session never sees a changed Product row
+    return [Product(**{**product.model_dump(), "stock": stock}) for product, stock in rows]
+
+
+def machine_stock_upsert(dialect_name: str, add: bool = True):
+    """INSERT ... ON CONFLICT for (machine_id, product_id, stock, updated_at) rows that adds to or replaces the stock"""
+    statement = dialect_insert(dialect_name, MachineStock.__table__)
+    stock = MachineStock.__table__.c.stock + statement.excluded.stock if add else statement.excluded.stock
+    return statement.on_conflict_do_update(
+        index_elements=["machine_id", "product_id"],
+        set_={"stock": stock, "updated_at": statement.excluded.updated_at},
+    )
+
+
+async def bump_stock_versions(session: AsyncSession, machine_ids: Iterable[int]):
+    """Count a stock write against each machine inside the caller's transaction
+
+    Each machine has its own counter, so sales at different machines never wait on one
+    another's row lock. Ids go in ascending order, so two writers lock them in the same order.
+    """
+    table = Machine.__table__
+    statement = (
+        table.update()
+        .where(table.c.id == bindparam("bumped_machine_id"))
+        .values(stock_version=func.coalesce(table.c.stock_version, 0) + 1)
+    )
+    params = [{"bumped_machine_id": machine_id} for machine_id in sorted(set(machine_ids))]
+    if params:
+        await session.exec(statement, params=params)
+
+
+async def restock_machine(session: AsyncSession, machine_id: int, quantities: Dict[int, int]) -> Dict[int, int]:
+    """Add stock per product id inside the caller's transaction and return the new levels"""
+    statement = machine_stock_upsert(session.bind.dialect.name)
+    now = datetime.utcnow()
+    await session.exec(statement, params=[
+        {"machine_id": machine_id, "product_id": product_id, "stock": quantity, "updated_at": now}
+        for product_id, quantity in quantities.items()
+    ])
+    await bump_stock_versions(session, [machine_id])
+    return await machine_stock(session, machine_id, quantities)
+
+
+async def current_stock(session: AsyncSession, product_ids: Iterable[int], machine_id: Optional[int] = None) -> Dict[int, int]:
+    """Stock per product from the global Product rows, or from one machine"""
+    if machine_id is not None:
+        return await machine_stock(session, machine_id, product_ids)
+    return dict((await session.exec(select(Product.id, Product.stock).where(Product.id.in_(list(product_ids))))).all())
+
+
+def decrement_statement(product_id: int, quantity: int, machine_id: Optional[int], now: datetime,
+                        version: Optional[int] = None):
+    """Guarded decrement returning the remaining stock, or no row when there is not enough
+
+    A Product row carries the catalog version taken in its transaction; a MachineStock
+    write is counted on its machine with bump_stock_versions instead.
+    """
+    if machine_id is None:
+        return (
+            update(Product)
+            .where(Product.id == product_id, Product.stock >= quantity)
+            .values(stock=Product.stock - quantity, updated_at=now, version=version)
+            .returning(Product.stock)
+        )
+    return (
+        update(MachineStock)
+        .where(MachineStock.machine_id == machine_id, MachineStock.product_id == product_id, MachineStock.stock >= quantity)
+        .values(stock=MachineStock.stock - quantity, updated_at=now)
+        .returning(MachineStock.stock)
+    )
+
+
+machines = MachineDirectory()
@@ -1,10 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from app.database import init_db
+from app.metrics import registry, CONTENT_TYPE
 from app.routers import vending
-from app.seed_data import seed_products
+from app.ai_parser import start_client_build
+from app.catalog_sync import catalog_sync
+from app.group_commit import ledger
+from app.warmup import warm_up, format_timings
 from app.config import settings
 
 app = FastAPI(
@@ -26,9 +29,24 @@ app.include_router(vending.router, prefix="/api/v1", tags=["vending"])
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database and seed data on startup"""
-    await init_db()
-    seed_products()
+    """Initialize database and seed data, then warm up caches before serving"""
+    timings = await warm_up()
+    print(f"✅ Warm-up finished in {format_timings(timings)}")
+    catalog_sync.start()
+    if settings.startup_mode == "lazy":
+        # Off the startup path, but usually done before the first AI parse needs it
+        start_client_build()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Commit purchases still queued for group commit and stop the catalog version checks"""
+    await ledger.close()
+    await catalog_sync.stop()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics in the text exposition format"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
 
 @app.get("/")
 async def root():
@@ -39,7 +57,11 @@ async def root():
         "endpoints": {
             "purchase": "POST /api/v1/purchase",
             "inventory": "GET /api/v1/inventory",
-            "transactions": "GET /api/v1/transactions"
+            "inventory_stream": "GET /api/v1/inventory/stream",
+            "transactions": "GET /api/v1/transactions",
+            "machines": "GET /api/v1/machines",
+            "catalog_import": "POST /api/v1/catalog/import",
+            "metrics": "GET /metrics"
         }
     }
 
@@ -1,6 +1,6 @@
-from sqlmodel import SQLModel, Field, Relationship
+from sqlmodel import SQLModel, Field, Relationship, Index
 from datetime import datetime
-from typing import Optional, List, TYPE_CHECKING
+from typing import Any, Dict, Optional, List, TYPE_CHECKING
 from pydantic import validator
 
 if TYPE_CHECKING:
@@ -8,14 +8,20 @@ if TYPE_CHECKING:
 
 class Product(SQLModel, table=True):
     """Product model for soda inventory"""
+    __table_args__ = (
+        # Unique, so bulk imports can upsert by name with ON CONFLICT (name)
+        Index("ux_product_name", "name", unique=True),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str = Field(index=True, max_length=100)
+    name: str = Field(max_length=100)
     price: float = Field(ge=0, description="Price in dollars")
     stock: int = Field(ge=0, default=0, description="Available stock quantity")
     description: Optional[str] = Field(default=None, max_length=500)
     category: str = Field(default="soda", max_length=50)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    version: Optional[int] = Field(default=None, index=True, description="Catalog version of the last write to this row")
     
 
     transactions: List["Transaction"] = Relationship(back_populates="product")
@@ -32,10 +38,36 @@ class Product(SQLModel, table=True):
             raise ValueError('Price cannot be negative')
         return round(v, 2)
 
+class Machine(SQLModel, table=True):
+    """A vending machine in the fleet; its stock lives in MachineStock"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True, max_length=100)
+    location: Optional[str] = Field(default=None, max_length=200)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    stock_version: Optional[int] = Field(default=0, description="Count of committed writes to this machine's stock")
+
+class MachineStock(SQLModel, table=True):
+    """Stock of one product in one machine"""
+    # The primary key leads with machine_id, so one machine's inventory is a range scan
+    # no matter how many machines share the table
+    machine_id: int = Field(foreign_key="machine.id", primary_key=True)
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    stock: int = Field(ge=0, default=0, description="Available stock quantity in this machine")
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 class Transaction(SQLModel, table=True):
     """Transaction model for purchase history"""
+    # Keyset pagination walks (created_at, id); the filtered variants lead with the filter column
+    __table_args__ = (
+        Index("ix_transaction_created_at_id", "created_at", "id"),
+        Index("ix_transaction_product_id_created_at_id", "product_id", "created_at", "id"),
+        Index("ix_transaction_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_transaction_machine_id_created_at_id", "machine_id", "created_at", "id"),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
     product_id: int = Field(foreign_key="product.id")
+    machine_id: Optional[int] = Field(default=None, foreign_key="machine.id", description="Machine the sale was made at; empty for global stock")
     quantity: int = Field(ge=1, description="Quantity purchased")
     total_amount: float = Field(ge=0, description="Total amount paid")
     payment_method: str = Field(default="cash", max_length=20)
@@ -57,6 +89,40 @@ class Transaction(SQLModel, table=True):
             raise ValueError('Total amount cannot be negative')
         return round(v, 2)
 
+class CatalogVersion(SQLModel, table=True):
+    """Single row counting product writes, bumped in the same transaction as each of them"""
+    id: int = Field(default=1, primary_key=True)
+    version: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class LedgerArchive(SQLModel, table=True):
+    """Manifest of the monthly archive tables that hold transactions moved out of the hot ledger"""
+    table_name: str = Field(primary_key=True, max_length=64)
+    period_start: datetime = Field(index=True, description="First day of the archived month")
+    rows: int = Field(default=0)
+    first_created_at: datetime
+    last_created_at: datetime
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SalesRollup(SQLModel, table=True):
+    """Hourly units and revenue per product, updated in the same commit as each sale"""
+    __table_args__ = (
+        Index("ix_salesrollup_bucket_start", "bucket_start"),
+    )
+    
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    bucket_start: datetime = Field(primary_key=True, description="Start of the hour")
+    units: int = Field(default=0)
+    revenue: float = Field(default=0)
+    transactions: int = Field(default=0)
+
+class ProductSalesTotal(SQLModel, table=True):
+    """All-time units and revenue per product, updated in the same commit as each sale"""
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    units: int = Field(default=0)
+    revenue: float = Field(default=0)
+    transactions: int = Field(default=0)
+
 class PurchaseRequest(SQLModel):
     """Request model for purchase endpoint"""
     message: str = Field(..., description="Natural language purchase request")
@@ -74,4 +140,113 @@ class PurchaseResponse(SQLModel):
     product_name: Optional[str] = None
     quantity: Optional[int] = None
     total_amount: Optional[float] = None
-    remaining_stock: Optional[int] = None 
\ No newline at end of file
+    remaining_stock: Optional[int] = None
+
+class MachineCreate(SQLModel):
+    """Request model for registering a machine"""
+    name: str = Field(..., max_length=100)
+    location: Optional[str] = Field(default=None, max_length=200)
+    
+    @validator('name')
+    def validate_name(cls, v):
+        if not v.strip():
+            raise ValueError('Machine name cannot be empty')
+        return v.strip()
+
+class RestockRequest(SQLModel):
+    """Request model for restocking a machine: quantity to add per product name"""
+    items: Dict[str, int] = Field(..., description="Product name to quantity added")
+    
+    @validator('items')
+    def validate_items(cls, v):
+        if not v:
+            raise ValueError('Provide at least one product')
+        if any(quantity <= 0 for quantity in v.values()):
+            raise ValueError('Restock quantities must be positive')
+        return {name.strip().lower(): quantity for name, quantity in v.items()}
+
+class CatalogImportRow(SQLModel):
+    """One row of a catalog import; empty fields leave the product as it is"""
+    name: str = Field(..., max_length=100)
+    price: Optional[float] = Field(default=None, ge=0)
+    stock: Optional[int] = Field(default=None, ge=0, description="Units added, or the new level with mode=set")
+    description: Optional[str] = Field(default=None, max_length=500)
+    category: Optional[str] = Field(default=None, max_length=50)
+    machine_id: Optional[int] = Field(default=None, description="Apply the stock to this machine instead of the global stock")
+    
+    @validator('name')
+    def validate_name(cls, v):
+        if not v.strip():
+            raise ValueError('Product name cannot be empty')
+        return v.strip().lower()
+
+class CatalogImportRowError(SQLModel):
+    """One rejected import row"""
+    line: Optional[int] = None
+    message: str
+
+class ProductChange(SQLModel):
+    """What an import did to one product: changed fields as [old, new]"""
+    name: str
+    action: str
+    fields: Dict[str, List[Any]] = {}
+
+class CatalogImportSummary(SQLModel):
+    """Response model for catalog imports"""
+    dry_run: bool
+    rows: int
+    products_created: int = 0
+    products_updated: int = 0
+    products_unchanged: int = 0
+    stock_delta: int = Field(default=0, description="Net change of global stock over all products")
+    machine_stock_rows: int = 0
+    catalog_version: Optional[int] = None
+    changes: List[ProductChange] = []
+    changes_truncated: bool = False
+
+class BatchPurchaseRequest(SQLModel):
+    """Request model for batch purchase endpoint"""
+    messages: List[str] = Field(default_factory=list, description="Natural language purchase requests, one per item or group of items")
+    message: Optional[str] = Field(default=None, description="A single request that may name several items")
+    
+    @validator('messages', each_item=True)
+    def validate_messages(cls, v):
+        if not v.strip():
+            raise ValueError('Message cannot be empty')
+        return v.strip()
+    
+    def all_messages(self) -> List[str]:
+        messages = list(self.messages)
+        if self.message and self.message.strip():
+            messages.append(self.message.strip())
+        return messages
+
+class BatchPurchaseResponse(SQLModel):
+    """Response model for batch purchase endpoint"""
+    success: bool
+    message: str
+    items: List[PurchaseResponse] = []
+    total_amount: Optional[float] = None
+
+class ProductSales(SQLModel):
+    """Sales figures for one product"""
+    product_id: int
+    product_name: Optional[str] = None
+    units: int
+    revenue: float
+    transactions: int
+
+class HourlySales(SQLModel):
+    """Sales figures for one hour"""
+    bucket_start: datetime
+    units: int
+    revenue: float
+    transactions: int
+
+class SalesStats(SQLModel):
+    """Response model for stats endpoint"""
+    total_units: int
+    total_revenue: float
+    total_transactions: int
+    top_sellers: List[ProductSales] = []
+    hourly: List[HourlySales] = []
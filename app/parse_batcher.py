@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Set, TypeVar
+
+T = TypeVar("T")
+
+
+class _PendingBatch:
+    def __init__(self, context: Any):
+        self.context = context
+        self.items: List[str] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher(Generic[T]):
+    """Collects concurrent submissions for up to max_wait seconds and runs them as one batch"""
+
+    def __init__(self, run_batch: Callable[[List[str], Any], Awaitable[List[T]]], max_size: int, max_wait: float):
+        self.run_batch = run_batch
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending: Dict[Hashable, _PendingBatch] = {}
+        # Strong references so running batches are not garbage collected mid-flight
+        self._running: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 1
+
+    async def submit(self, group: Hashable, item: str, context: Any) -> T:
+        """Queue an item with others of the same group and wait for its own result"""
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(group)
+        if batch is None:
+            batch = self._pending[group] = _PendingBatch(context)
+            batch.timer = loop.call_later(self.max_wait, self._flush, group, batch)
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= self.max_size:
+            self._flush(group, batch)
+        return await future
+
+    def _flush(self, group: Hashable, batch: _PendingBatch):
+        if self._pending.get(group) is not batch:
+            return
+        del self._pending[group]
+        batch.timer.cancel()
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: _PendingBatch):
+        try:
+            results = await self.run_batch(batch.items, batch.context)
+        except BaseException as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for index, future in enumerate(batch.futures):
+            # A caller that gave up has a cancelled future; the others still get their answer
+            if future.done():
+                continue
+            if index < len(results):
+                future.set_result(results[index])
+            else:
+                future.set_exception(RuntimeError("batch returned fewer results than items"))
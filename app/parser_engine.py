@@ -0,0 +1,141 @@
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.intent_cache import catalog_fingerprint
+
+_NEGATIVE = re.compile(r"\b(?:dont|don't|not|no|never|refuse|decline|cancel|stop)\b")
+_PURCHASE = re.compile(r"\b(?:buy|purchase|get|want|need|give me|i'll take|i want|can i have|may i have)\b")
+_QUERY = re.compile(
+    r"\b(?:what|which|how many|how much|is there|are there|show me|list|available|do you have|what's available|inventory|stock|products)\b"
+)
+_CANCEL = re.compile(r"\b(?:cancel|stop|abort|undo|never mind|forget it)\b")
+_VERB_QUANTITY = re.compile(r"(?:buy|get|want|need)\s+(\d+)")
+_UNITS = ["can", "cans", "bottle", "bottles", "soda", "sodas"]
+_SPACES = re.compile(r"\s+")
+
+ENGINE_CACHE_SIZE = 4
+
+
+def _plural_forms(name: str) -> List[str]:
+    """Surface forms a product name can take in a message"""
+    forms = [name]
+    if not name.endswith("s"):
+        forms.append(name + "s")
+    if name.endswith(("s", "x", "z", "ch", "sh")):
+        forms.append(name + "es")
+    return forms
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """Build a regex alternation from a character trie so matching cost does not grow with catalog size"""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [
+            (r"\s*" if char == " " else re.escape(char)) + build(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # Greedy optional: the longer name is tried before the shorter prefix
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class ParserEngine:
+    """Fallback intent parser compiled once from a product list"""
+
+    def __init__(self, available_products: Sequence[str]):
+        self._surface_to_name: Dict[str, str] = {}
+        for name in available_products:
+            for form in _plural_forms(name.lower()):
+                self._surface_to_name.setdefault(_SPACES.sub("", form), name)
+
+        self.product_pattern: Optional[re.Pattern] = None
+        self.item_pattern: Optional[re.Pattern] = None
+        unit_alternation = "|".join(_UNITS)
+        if available_products:
+            products = _trie_regex(form for name in available_products for form in _plural_forms(name.lower()))
+            self.product_pattern = re.compile(r"(?<!\w)(" + products + r")(?!\w)")
+            # "2 cokes", "a fanta", "3 cans of sprite": optional count and unit before each product
+            self.item_pattern = re.compile(
+                r"(?:\b(\d+|a|an|one)\s+(?:(?:" + "|".join(_UNITS) + r")\s+(?:of\s+)?)?)?"
+                r"(?<!\w)(" + products + r")(?!\w)"
+            )
+            unit_alternation += "|" + products
+        self.unit_quantity_pattern = re.compile(r"(\d+)\s*(?:" + unit_alternation + ")")
+
+    @staticmethod
+    def classify(message: str) -> Tuple[bool, bool, bool, bool]:
+        """Return (negative, purchase, query, cancel) keyword flags"""
+        return (
+            _NEGATIVE.search(message) is not None,
+            _PURCHASE.search(message) is not None,
+            _QUERY.search(message) is not None,
+            _CANCEL.search(message) is not None,
+        )
+
+    def extract_product(self, message: str) -> Optional[str]:
+        """Leftmost, longest product mention in the message"""
+        if self.product_pattern is None:
+            return None
+        match = self.product_pattern.search(message)
+        if match is None:
+            return None
+        return self._surface_to_name.get(_SPACES.sub("", match.group(1)))
+
+    def extract_items(self, message: str) -> List[Tuple[str, int]]:
+        """Every (product, quantity) mentioned, in message order, merging repeats"""
+        if self.item_pattern is None:
+            return []
+        items: Dict[str, int] = {}
+        for match in self.item_pattern.finditer(message):
+            name = self._surface_to_name.get(_SPACES.sub("", match.group(2)))
+            if name is None:
+                continue
+            count = match.group(1)
+            items[name] = items.get(name, 0) + (int(count) if count and count.isdigit() else 1)
+        return list(items.items())
+
+    def is_item_list(self, message: str) -> bool:
+        """True when two or more products are named and each has a count, as in '2 cokes and a fanta'"""
+        if self.item_pattern is None:
+            return False
+        matches = list(self.item_pattern.finditer(message))
+        names = {self._surface_to_name.get(_SPACES.sub("", match.group(2))) for match in matches}
+        return len(names) > 1 and all(match.group(1) for match in matches)
+
+    def extract_quantity(self, message: str) -> int:
+        """Quantity attached to a unit or product, then to a purchase verb, defaulting to 1"""
+        match = self.unit_quantity_pattern.search(message) or _VERB_QUANTITY.search(message)
+        if match:
+            return int(match.group(1))
+        return 1
+
+
+_engines: "OrderedDict[int, ParserEngine]" = OrderedDict()
+
+
+def get_engine(available_products: Sequence[str]) -> ParserEngine:
+    """Return the compiled engine for this product list, building it only when the catalog changes"""
+    key = catalog_fingerprint(available_products)
+    engine = _engines.get(key)
+    if engine is None:
+        engine = ParserEngine(available_products)
+        _engines[key] = engine
+        if len(_engines) > ENGINE_CACHE_SIZE:
+            _engines.popitem(last=False)
+    else:
+        _engines.move_to_end(key)
+    return engine
@@ -1,118 +1,454 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
-from typing import List
-from datetime import datetime
-
-from app.database import get_session
-from app.models import Product, Transaction, PurchaseRequest, PurchaseResponse
-from app.ai_parser import parse_purchase_request
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import select, insert, tuple_, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import codecs
+import logging
+
+from app.archive import archive_table, archived_tables
+from app.config import settings
+from app.database import get_async_session, get_async_read_session, async_read_engine
+from app.models import (
+    Product, Transaction, PurchaseRequest, PurchaseResponse, BatchPurchaseRequest, BatchPurchaseResponse,
+    SalesRollup, ProductSalesTotal, SalesStats, ProductSales, HourlySales, Machine, MachineCreate, RestockRequest,
+    CatalogImportSummary
+)
+from app.ai_parser import parse_purchase_request, intent_cache, llm_breaker, llm_limit, IntentType
+from app.catalog import catalog, CatalogEntry
+from app.catalog_import import CatalogImportInvalid, PlanBuilder, format_for_content_type, import_catalog
+from app.catalog_sync import bump_version
+from app.group_commit import ledger
+from app.idempotency import idempotent_purchases, IdempotencyKeyReused
+from app.inventory_feed import inventory_feed
+from app.inventory_snapshot import current_inventory, etag_matches, serialize_products
+from app.machines import (
+    machines, machine_inventory, restock_machine, current_stock, decrement_statement, bump_stock_versions
+)
+from app.metrics import STAGE_SECONDS, PURCHASES, REQUEST_ERRORS
+from app.pagination import encode_cursor, decode_cursor
+from app.export import stream_transactions, EXPORT_MEDIA_TYPES
+from app.rollups import record_sales, hour_bucket
 from app.seed_data import get_available_products
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+MACHINE_QUERY = Query(None, description="Scope to this machine's stock instead of the global stock")
+IDEMPOTENCY_KEY_HEADER = Header(None, max_length=255, description="Retries with the same key get the first response back")
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+async def _require_machine(session: AsyncSession, machine_id: Optional[int]):
+    if machine_id is not None and not await machines.exists(session, machine_id):
+        raise HTTPException(status_code=404, detail=f"Machine {machine_id} not found")
+
 @router.get("/inventory", response_model=List[Product])
-async def get_inventory(session: Session = Depends(get_session)):
+async def get_inventory(request: Request, machine_id: Optional[int] = MACHINE_QUERY):
     """Get current inventory"""
-    products = session.exec(select(Product)).all()
-    return products
+    if machine_id is not None:
+        async with AsyncSession(async_read_engine) as session:
+            await _require_machine(session, machine_id)
+            body, etag = serialize_products(await machine_inventory(session, machine_id))
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+    
+    snapshot = await current_inventory()
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@router.get("/inventory/stream")
+async def stream_inventory(
+    machine_id: Optional[int] = MACHINE_QUERY,
+    last_event_id: Optional[str] = Header(None, description="Id of the last event received, to resume after a reconnect")
+):
+    """Server-sent inventory events: a snapshot, then per-product stock and price changes"""
+    async with AsyncSession(async_read_engine) as session:
+        await _require_machine(session, machine_id)
+        await catalog.ensure_loaded(session)
+    return StreamingResponse(
+        inventory_feed.events(machine_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/transactions", response_model=List[Transaction])
-async def get_transactions(session: Session = Depends(get_session)):
-    """Get transaction history"""
-    transactions = session.exec(select(Transaction)).all()
+async def get_transactions(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    product_id: Optional[int] = None,
+    machine_id: Optional[int] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="Only transactions at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only transactions before this time"),
+    session: AsyncSession = Depends(get_async_read_session)
+):
+    """Get transaction history, newest first, one keyset page at a time"""
+    position = None
+    if cursor is not None:
+        try:
+            position = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    def conditions(columns):
+        # `columns` is the Transaction model or an archive table's .c; both expose the same names
+        where = []
+        if product_id is not None:
+            where.append(columns.product_id == product_id)
+        if machine_id is not None:
+            where.append(columns.machine_id == machine_id)
+        if status is not None:
+            where.append(columns.status == status)
+        if since is not None:
+            where.append(columns.created_at >= since)
+        if until is not None:
+            where.append(columns.created_at < until)
+        if position is not None:
+            where.append(tuple_(columns.created_at, columns.id) < position)
+        return where
+    
+    statement = (
+        select(Transaction)
+        .where(*conditions(Transaction))
+        .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+        .limit(limit + 1)
+    )
+    transactions = list((await session.exec(statement)).all())
+    if len(transactions) <= limit:
+        # The hot table ran out; archived months are all older, so the page continues there
+        bounds = [bound for bound in (until, position[0] if position else None) if bound is not None]
+        for entry in reversed(await archived_tables(session, since, min(bounds) if bounds else None)):
+            table = archive_table(entry.table_name)
+            rows = (await session.exec(
+                select(*table.c)
+                .where(*conditions(table.c))
+                .order_by(table.c.created_at.desc(), table.c.id.desc())
+                .limit(limit + 1 - len(transactions))
+            )).all()
+            transactions.extend(Transaction(**row._mapping) for row in rows)
+            if len(transactions) > limit:
+                break
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
     return transactions
 
+@router.get("/transactions/export")
+async def export_transactions(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    since: Optional[datetime] = Query(None, description="Watermark: created_at of the last exported row"),
+    since_id: Optional[int] = Query(None, description="Watermark: id of the last exported row"),
+    batch_size: int = Query(1000, ge=1, le=10000),
+    machine_id: Optional[int] = None
+):
+    """Stream the transaction ledger oldest-first as NDJSON or CSV"""
+    return StreamingResponse(
+        stream_transactions(format, since, since_id, batch_size, machine_id),
+        media_type=EXPORT_MEDIA_TYPES[format]
+    )
+
+@router.get("/stats", response_model=SalesStats)
+async def get_stats(
+    since: Optional[datetime] = Query(None, description="Start of the hourly series (default: 24 hours ago)"),
+    until: Optional[datetime] = Query(None, description="End of the hourly series (default: now)"),
+    top: int = Query(5, ge=1, le=100),
+    session: AsyncSession = Depends(get_async_read_session)
+):
+    """Get sales totals, top sellers and per-hour sales from the rollup tables"""
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(hours=24)
+    
+    totals = (await session.exec(select(ProductSalesTotal))).all()
+    top_sellers = sorted(totals, key=lambda row: row.units, reverse=True)[:top]
+    hourly = (await session.exec(
+        select(
+            SalesRollup.bucket_start,
+            func.sum(SalesRollup.units),
+            func.sum(SalesRollup.revenue),
+            func.sum(SalesRollup.transactions)
+        )
+        .where(SalesRollup.bucket_start >= hour_bucket(since), SalesRollup.bucket_start < until)
+        .group_by(SalesRollup.bucket_start)
+        .order_by(SalesRollup.bucket_start)
+    )).all()
+    
+    return SalesStats(
+        total_units=sum(row.units for row in totals),
+        total_revenue=round(sum(row.revenue for row in totals), 2),
+        total_transactions=sum(row.transactions for row in totals),
+        top_sellers=[
+            ProductSales(
+                product_id=row.product_id,
+                product_name=getattr(catalog.get_by_id(row.product_id), "name", None),
+                units=row.units,
+                revenue=round(row.revenue, 2),
+                transactions=row.transactions
+            )
+            for row in top_sellers
+        ],
+        hourly=[
+            HourlySales(bucket_start=bucket_start, units=units, revenue=round(revenue, 2), transactions=count)
+            for bucket_start, units, revenue, count in hourly
+        ]
+    )
+
+@router.get("/machines", response_model=List[Machine])
+async def list_machines(
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, description="Last id of the previous page"),
+    session: AsyncSession = Depends(get_async_read_session)
+):
+    """List machines in id order, one page at a time"""
+    statement = select(Machine).order_by(Machine.id).limit(limit)
+    if after_id is not None:
+        statement = statement.where(Machine.id > after_id)
+    return (await session.exec(statement)).all()
+
+@router.post("/machines", response_model=Machine, status_code=201)
+async def create_machine(request: MachineCreate, session: AsyncSession = Depends(get_async_session)):
+    """Register a machine; it starts empty until restocked"""
+    machine = Machine(name=request.name, location=request.location)
+    session.add(machine)
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail=f"Machine '{request.name}' already exists")
+    machines.add(machine.id)
+    return machine
+
+@router.post("/machines/{machine_id}/restock")
+async def restock(machine_id: int, request: RestockRequest, session: AsyncSession = Depends(get_async_session)):
+    """Add stock to one machine, per product name"""
+    await _require_machine(session, machine_id)
+    await catalog.ensure_loaded(session)
+    unknown = [name for name in request.items if catalog.get(name) is None]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown products: {', '.join(unknown)}")
+    stock = await restock_machine(session, machine_id, {catalog.get(name).id: quantity for name, quantity in request.items.items()})
+    await session.commit()
+    inventory_feed.stock_changed(machine_id, stock)
+    return {"machine_id": machine_id, "stock": {catalog.get_by_id(product_id).name: level for product_id, level in stock.items()}}
+
+@router.post("/catalog/import", response_model=CatalogImportSummary)
+async def import_catalog_rows(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|json|ndjson)$", description="Input format (default: from Content-Type)"),
+    mode: str = Query("add", pattern="^(add|set)$", description="add: stock is added to the current level; set: stock is the new level"),
+    dry_run: bool = Query(False, description="Validate and report the changes without writing them")
+):
+    """Create, update and restock products, and machine stock, from CSV, JSON or NDJSON rows"""
+    fmt = format or format_for_content_type(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send text/csv, application/json or application/x-ndjson, or pass format")
+    # Rows are validated as the body arrives; only the merged plan is held, not the upload
+    builder = PlanBuilder(fmt, mode)
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > settings.catalog_import_max_bytes:
+                raise HTTPException(status_code=413, detail=f"Imports are limited to {settings.catalog_import_max_bytes} bytes")
+            builder.feed(decoder.decode(chunk))
+        builder.feed(decoder.decode(b"", final=True))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import body must be UTF-8")
+    try:
+        return await import_catalog(builder.finish(), dry_run)
+    except CatalogImportInvalid as e:
+        raise HTTPException(status_code=422, detail={"message": str(e), "errors": [error.model_dump() for error in e.errors]})
+
+@router.get("/parser/cache")
+async def get_parser_cache_stats():
+    """Get intent parse cache counters"""
+    return intent_cache.stats()
+
+@router.get("/parser/llm")
+async def get_parser_llm_status():
+    """Get LLM circuit breaker state and concurrency usage"""
+    return {"breaker": llm_breaker.stats(), "concurrency": llm_limit.stats()}
+
 @router.post("/purchase", response_model=PurchaseResponse)
-async def purchase_soda(request: PurchaseRequest, session: Session = Depends(get_session)):
+async def purchase_soda(
+    request: PurchaseRequest,
+    response: Response,
+    machine_id: Optional[int] = MACHINE_QUERY,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    session: AsyncSession = Depends(get_async_session)
+):
     """Process natural language purchase request"""
     try:
-        
-        available_products = get_available_products()
-        
-        
-        intent = parse_purchase_request(request.message, available_products)
-        
-        
-        if intent.intent.value == "query":
-            products = session.exec(select(Product)).all()
-            product_list = [f"{p.name} (${p.price}) - {p.stock} in stock" for p in products]
+        result, replayed = await idempotent_purchases.run(
+            idempotency_key, ("purchase", machine_id, request.message),
+            lambda: _purchase(request, machine_id, session)
+        )
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Purchase request failed")
+        REQUEST_ERRORS.inc(endpoint="purchase", error=type(e).__name__)
+        return PurchaseResponse(
+            success=False,
+            message=f"Error processing request: {str(e)}"
+        )
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
+
+async def _purchase(request: PurchaseRequest, machine_id: Optional[int], session: AsyncSession) -> PurchaseResponse:
+    """Parse and fulfil one purchase request"""
+    # Runs inside the idempotent call: a replay returns the stored response without validating anything again
+    await _require_machine(session, machine_id)
+    with STAGE_SECONDS.time(endpoint="purchase", stage="catalog"):
+        available_products = await get_available_products(session)
+        # Hand the connection back to the pool while the LLM call is in flight
+        await session.close()
+
+    
+    with STAGE_SECONDS.time(endpoint="purchase", stage="parse"):
+        intent = await parse_purchase_request(request.message, available_products)
+    
+    
+    if intent.intent.value == "query":
+        entries = catalog.entries()
+        if machine_id is None:
+            stock = {p.id: p.stock for p in entries}
+        else:
+            stock = await current_stock(session, [p.id for p in entries], machine_id)
+        product_list = [f"{p.name} (${p.price}) - {stock[p.id]} in stock" for p in entries]
+        return PurchaseResponse(
+            success=True,
+            message=f"Available products: {', '.join(product_list)}",
+            product_name=None,
+            quantity=None,
+            total_amount=None,
+            remaining_stock=None
+        )
+    
+    elif intent.intent.value == "refuse":
+        return PurchaseResponse(
+            success=True,
+            message="No problem! Let me know if you change your mind.",
+            product_name=None,
+            quantity=None,
+            total_amount=None,
+            remaining_stock=None
+        )
+    
+    elif intent.intent.value == "cancel":
+        return PurchaseResponse(
+            success=True,
+            message="Transaction cancelled. Is there anything else I can help you with?",
+            product_name=None,
+            quantity=None,
+            total_amount=None,
+            remaining_stock=None
+        )
+    
+    elif intent.intent.value == "unknown":
+        return PurchaseResponse(
+            success=False,
+            message="I'm not sure what you want to do. You can ask about our products or try to make a purchase.",
+            product_name=None,
+            quantity=None,
+            total_amount=None,
+            remaining_stock=None
+        )
+    
+    elif intent.intent.value == "purchase":
+        if len(intent.items) > 1:
+            # Taking only the first product would report success for a partial order
+            PURCHASES.inc(endpoint="purchase", outcome="multi_item")
             return PurchaseResponse(
-                success=True,
-                message=f"Available products: {', '.join(product_list)}",
-                product_name=None,
-                quantity=None,
-                total_amount=None,
-                remaining_stock=None
+                success=False,
+                message=f"That order names {len(intent.items)} products. "
+                        "Send it to /api/v1/purchase/batch to buy them together."
             )
         
-        elif intent.intent.value == "refuse":
+        if not intent.product_name:
             return PurchaseResponse(
-                success=True,
-                message="No problem! Let me know if you change your mind.",
-                product_name=None,
-                quantity=None,
-                total_amount=None,
-                remaining_stock=None
+                success=False,
+                message="I couldn't understand which product you want to buy. Available products: " + ", ".join(available_products)
             )
         
-        elif intent.intent.value == "cancel":
+        if not intent.quantity or intent.quantity <= 0:
             return PurchaseResponse(
-                success=True,
-                message="Transaction cancelled. Is there anything else I can help you with?",
-                product_name=None,
-                quantity=None,
-                total_amount=None,
-                remaining_stock=None
+                success=False,
+                message="Please specify a valid quantity to purchase."
             )
         
-        elif intent.intent.value == "unknown":
+        
+        product = catalog.get(intent.product_name)
+        if not product:
             return PurchaseResponse(
                 success=False,
-                message="I'm not sure what you want to do. You can ask about our products or try to make a purchase.",
-                product_name=None,
-                quantity=None,
-                total_amount=None,
-                remaining_stock=None
+                message=f"Product '{intent.product_name}' not found. Available products: " + ", ".join(available_products)
             )
         
-        elif intent.intent.value == "purchase":
-            if not intent.product_name:
-                return PurchaseResponse(
-                    success=False,
-                    message="I couldn't understand which product you want to buy. Available products: " + ", ".join(available_products)
-                )
-            
-            if not intent.quantity or intent.quantity <= 0:
-                return PurchaseResponse(
-                    success=False,
-                    message="Please specify a valid quantity to purchase."
-                )
-            
-            
-            product = session.exec(select(Product).where(Product.name == intent.product_name)).first()
-            if not product:
+        
+        # Only the global stock is cached in the catalog; a machine's stock is checked by the decrement
+        if machine_id is None and product.stock < intent.quantity:
+            # The cached stock may be stale; confirm with a plain read so a sold-out
+            # product is rejected without queueing for the write lock
+            with STAGE_SECONDS.time(endpoint="purchase", stage="stock_check"):
+                available = (await session.exec(select(Product.stock).where(Product.id == product.id))).one()
+                await session.close()
+            catalog.set_stock(product.id, available)
+            if available < intent.quantity:
+                PURCHASES.inc(endpoint="purchase", outcome="out_of_stock")
                 return PurchaseResponse(
                     success=False,
-                    message=f"Product '{intent.product_name}' not found. Available products: " + ", ".join(available_products)
+                    message=f"Sorry, only {available} {product.name} available. You requested {intent.quantity}."
                 )
-            
-            
-            if product.stock < intent.quantity:
-                return PurchaseResponse(
-                    success=False,
-                    message=f"Sorry, only {product.stock} {product.name} available. You requested {intent.quantity}."
+        
+        
+        total_amount = product.price * intent.quantity
+        
+        if ledger.enabled:
+            # Same guarded decrement and ledger row, committed together with concurrent sales
+            with STAGE_SECONDS.time(endpoint="purchase", stage="group_commit"):
+                remaining_stock = await ledger.sell(product.id, intent.quantity, total_amount, machine_id)
+        else:
+            # Guarded decrement: the stock check and the write are one statement, so
+            # concurrent buyers across workers can never take the stock below zero
+            with STAGE_SECONDS.time(endpoint="purchase", stage="decrement"):
+                # Only Product writes take the catalog version row; a machine counts its own writes
+                version = await bump_version(session) if machine_id is None else None
+                result = await session.exec(
+                    decrement_statement(product.id, intent.quantity, machine_id, datetime.utcnow(), version)
                 )
-            
-            
-            total_amount = product.price * intent.quantity
-            
-            
-            product.stock -= intent.quantity
-            product.updated_at = datetime.utcnow()
-            
-            
+                remaining_stock = result.scalar_one_or_none()
+                if remaining_stock is not None and machine_id is not None:
+                    await bump_stock_versions(session, [machine_id])
+        if remaining_stock is None:
+            await session.rollback()
+            available = (await current_stock(session, [product.id], machine_id))[product.id]
+            if machine_id is None:
+                catalog.set_stock(product.id, available)
+            PURCHASES.inc(endpoint="purchase", outcome="out_of_stock")
+            return PurchaseResponse(
+                success=False,
+                message=f"Sorry, only {available} {product.name} available. You requested {intent.quantity}."
+            )
+        
+        
+        if not ledger.enabled:
             transaction = Transaction(
                 product_id=product.id,
+                machine_id=machine_id,
                 quantity=intent.quantity,
                 total_amount=total_amount,
                 payment_method="cash",
@@ -120,27 +456,159 @@ async def purchase_soda(request: PurchaseRequest, session: Session = Depends(get
             )
             
             session.add(transaction)
-            session.add(product)  
-            session.commit()
-            session.refresh(product)  
-            
-            return PurchaseResponse(
-                success=True,
-                message=f"Successfully purchased {intent.quantity} {product.name} for ${total_amount:.2f}",
-                product_name=product.name,
-                quantity=intent.quantity,
-                total_amount=total_amount,
-                remaining_stock=product.stock
-            )
-        
+            with STAGE_SECONDS.time(endpoint="purchase", stage="commit"):
+                await record_sales(session, [(product.id, intent.quantity, total_amount, transaction.created_at)])
+                await session.commit()
+        if machine_id is None:
+            catalog.set_stock(product.id, remaining_stock)
         else:
-            return PurchaseResponse(
-                success=False,
-                message="I couldn't understand your request. Please try again."
-            )
-            
-    except Exception as e:
+            inventory_feed.stock_changed(machine_id, {product.id: remaining_stock})
+        PURCHASES.inc(endpoint="purchase", outcome="completed")
+        
         return PurchaseResponse(
+            success=True,
+            message=f"Successfully purchased {intent.quantity} {product.name} for ${total_amount:.2f}",
+            product_name=product.name,
+            quantity=intent.quantity,
+            total_amount=total_amount,
+            remaining_stock=remaining_stock
+        )
+    
+    else:
+        return PurchaseResponse(
+            success=False,
+            message="I couldn't understand your request. Please try again."
+        )
+
+@router.post("/purchase/batch", response_model=BatchPurchaseResponse)
+async def purchase_batch(
+    request: BatchPurchaseRequest,
+    response: Response,
+    machine_id: Optional[int] = MACHINE_QUERY,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """Process several purchase requests as one all-or-nothing order"""
+    messages = request.all_messages()
+    if not messages:
+        raise HTTPException(status_code=422, detail="Provide at least one message")
+    try:
+        result, replayed = await idempotent_purchases.run(
+            idempotency_key, ("purchase_batch", machine_id, tuple(messages)),
+            lambda: _purchase_batch(messages, machine_id, session)
+        )
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Batch purchase request failed")
+        REQUEST_ERRORS.inc(endpoint="purchase_batch", error=type(e).__name__)
+        return BatchPurchaseResponse(
             success=False,
             message=f"Error processing request: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
+
+async def _purchase_batch(messages: List[str], machine_id: Optional[int], session: AsyncSession) -> BatchPurchaseResponse:
+    """Parse every message and fulfil them as one order"""
+    # Runs inside the idempotent call, like _purchase, so a replay skips it
+    await _require_machine(session, machine_id)
+    with STAGE_SECONDS.time(endpoint="purchase_batch", stage="catalog"):
+        available_products = await get_available_products(session)
+        # Hand the connection back to the pool while the LLM calls are in flight
+        await session.close()
+    with STAGE_SECONDS.time(endpoint="purchase_batch", stage="parse"):
+        intents = await asyncio.gather(*(parse_purchase_request(message, available_products) for message in messages))
+    
+    lines: List[Tuple[CatalogEntry, int]] = []
+    for message, intent in zip(messages, intents):
+        items = intent.line_items() if intent.intent == IntentType.PURCHASE else []
+        if not items:
+            return BatchPurchaseResponse(
+                success=False,
+                message=f"I couldn't find a purchase in '{message}'. Available products: " + ", ".join(available_products)
+            )
+        for item in items:
+            product = catalog.get(item.product_name)
+            if not product:
+                return BatchPurchaseResponse(
+                    success=False,
+                    message=f"Product '{item.product_name}' not found. Available products: " + ", ".join(available_products)
+                )
+            lines.append((product, item.quantity))
+    
+    wanted: Dict[int, int] = {}
+    for product, quantity in lines:
+        wanted[product.id] = wanted.get(product.id, 0) + quantity
+    
+    # One guarded decrement per product, each checked through its RETURNING row; executemany
+    # rowcounts are not reliable on every driver. Any short product fails the whole order
+    now = datetime.utcnow()
+    remaining: Dict[int, int] = {}
+    with STAGE_SECONDS.time(endpoint="purchase_batch", stage="decrement"):
+        version = await bump_version(session) if machine_id is None else None
+        for product_id, quantity in wanted.items():
+            left = (await session.exec(decrement_statement(product_id, quantity, machine_id, now, version))).scalar_one_or_none()
+            if left is None:
+                break
+            remaining[product_id] = left
+    if len(remaining) != len(wanted):
+        await session.rollback()
+        current = await current_stock(session, wanted, machine_id)
+        shortages = []
+        for product_id, quantity in wanted.items():
+            if machine_id is None:
+                catalog.set_stock(product_id, current[product_id])
+            if current[product_id] < quantity:
+                shortages.append(f"only {current[product_id]} {catalog.get_by_id(product_id).name} available (requested {quantity})")
+        PURCHASES.inc(endpoint="purchase_batch", outcome="out_of_stock")
+        return BatchPurchaseResponse(success=False, message="Sorry, " + "; ".join(shortages) + ". Nothing was purchased.")
+    
+    with STAGE_SECONDS.time(endpoint="purchase_batch", stage="commit"):
+        if machine_id is not None:
+            await bump_stock_versions(session, [machine_id])
+        await session.exec(
+            insert(Transaction),
+            params=[
+                {
+                    "product_id": product.id,
+                    "machine_id": machine_id,
+                    "quantity": quantity,
+                    "total_amount": round(product.price * quantity, 2),
+                    "payment_method": "cash",
+                    "status": "completed",
+                    "created_at": now
+                }
+                for product, quantity in lines
+            ]
+        )
+        await record_sales(session, [(product.id, quantity, round(product.price * quantity, 2), now) for product, quantity in lines])
+        await session.commit()
+    if machine_id is None:
+        for product_id, stock in remaining.items():
+            catalog.set_stock(product_id, stock)
+    else:
+        inventory_feed.stock_changed(machine_id, remaining)
+    PURCHASES.inc(endpoint="purchase_batch", outcome="completed")
+    
+    items = [
+        PurchaseResponse(
+            success=True,
+            message=f"Purchased {quantity} {product.name} for ${product.price * quantity:.2f}",
+            product_name=product.name,
+            quantity=quantity,
+            total_amount=round(product.price * quantity, 2),
+            remaining_stock=remaining[product.id]
+        )
+        for product, quantity in lines
+    ]
+    total_amount = round(sum(item.total_amount for item in items), 2)
+    return BatchPurchaseResponse(
+        success=True,
+        message=f"Successfully purchased {sum(item.quantity for item in items)} items for ${total_amount:.2f}",
+        items=items,
+        total_amount=total_amount
+    )
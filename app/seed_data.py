@@ -1,6 +1,10 @@
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Sequence
 from app.database import engine
 from app.models import Product
+from app.catalog import catalog
+from app.catalog_sync import bump_version_sync, ensure_catalog_version
 
 def seed_products():
     """Seed the database with sample products"""
@@ -49,26 +53,28 @@ def seed_products():
         }
     ]
     
+    # Every product write stamps a catalog version, so the version row comes first
+    ensure_catalog_version()
     with Session(engine) as session:
         
-        existing_products = session.exec(select(Product)).all()
-        if existing_products:
+        if session.exec(select(Product.id).limit(1)).first() is not None:
             print("Products already exist in database")
             return
         
         
+        version = bump_version_sync(session)
         for product_data in products:
-            product = Product(**product_data)
+            product = Product(**product_data, version=version)
             session.add(product)
         
         session.commit()
+        catalog.invalidate()
         print(f"✅ Seeded {len(products)} products successfully")
 
-def get_available_products():
+async def get_available_products(session: AsyncSession) -> Sequence[str]:
     """Get list of available products for AI parsing"""
-    with Session(engine) as session:
-        products = session.exec(select(Product)).all()
-        return [product.name for product in products]
+    await catalog.ensure_loaded(session)
+    return catalog.names()
 
 if __name__ == "__main__":
     seed_products() 
\ No newline at end of file
@@ -0,0 +1,36 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers with that key share its outcome"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Task"] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """Await the in-flight call for key, starting it if there is none"""
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            # A task rather than a plain await, so a cancelled leader does not cancel its followers
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: "asyncio.Task"):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller has gone away
+            task.exception()
@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.ai_parser import PurchaseIntent
+from app.catalog import catalog
+from app.catalog_sync import catalog_sync
+from app.database import async_engine, async_read_engine, init_db
+from app.inventory_snapshot import inventory_snapshot
+from app.metrics import registry
+from app.models import Product
+from app.parser_engine import get_engine
+from app.seed_data import seed_products
+
+startup_timings: Dict[str, float] = {}
+registry.gauge(
+    "soda_startup_phase_seconds", "Duration of each startup and warm-up phase", ["phase"],
+    lambda: {(phase,): seconds for phase, seconds in startup_timings.items()}
+)
+
+
+@contextmanager
+def _phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - started
+
+
+async def warm_up() -> Dict[str, float]:
+    """Prepare the database, then build what the first requests would otherwise build on demand"""
+    startup_timings.clear()
+    with _phase("init_db"):
+        await init_db()
+    with _phase("seed"):
+        seed_products()
+    with _phase("catalog"):
+        async with AsyncSession(async_engine) as session:
+            await catalog_sync.load(session)
+    names = catalog.names()
+    with _phase("parser"):
+        get_engine(names)
+    with _phase("prompt"):
+        PurchaseIntent._system_prompt(names)
+    with _phase("inventory"):
+        # Also opens the first read-pool connection, so its PRAGMAs run now rather than on a request
+        version = catalog.version
+        async with AsyncSession(async_read_engine) as session:
+            inventory_snapshot.build(version, (await session.exec(select(Product))).all())
+    startup_timings["total"] = sum(startup_timings.values())
+    return dict(startup_timings)
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    phases = ", ".join(f"{phase} {seconds * 1000:.1f}ms" for phase, seconds in timings.items() if phase != "total")
+    return f"{timings.get('total', 0.0) * 1000:.1f}ms ({phases})"
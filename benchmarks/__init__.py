@@ -0,0 +1,3 @@
+"""
+Benchmarks and load-test harness for the Soda Vending Machine API
+"""
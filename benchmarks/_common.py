@@ -0,0 +1,66 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+LEDGER_STATUSES = ["completed"] * 18 + ["refunded", "failed"]
+
+
+def use_temp_database(name: str = "bench.db") -> str:
+    """Point the app at a fresh SQLite file; must run before importing app modules"""
+    path = os.path.join(tempfile.mkdtemp(prefix="soda-bench-"), name)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("DEBUG", "false")
+    os.environ.setdefault("OPENAI_API_KEY", "dummy-key-for-testing")
+    return path
+
+
+def fill_ledger(path: str, rows: int, days: int = 180, chunk: int = 50000) -> datetime:
+    """Bulk-insert synthetic transactions spread evenly over the last `days` days"""
+    rng = random.Random(3)
+    start = datetime.utcnow() - timedelta(days=days)
+    if not rows:
+        return start
+    step = timedelta(days=days) / rows
+    with sqlite3.connect(path) as db:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=OFF")
+        for offset in range(0, rows, chunk):
+            db.executemany(
+                'INSERT INTO "transaction" (product_id, quantity, total_amount, payment_method, status, created_at) '
+                "VALUES (?, ?, ?, 'cash', ?, ?)",
+                [
+                    (rng.randint(1, 6), q, round(q * 1.5, 2), rng.choice(LEDGER_STATUSES), str(start + step * i))
+                    for i in range(offset, min(rows, offset + chunk))
+                    for q in (rng.randint(1, 4),)
+                ],
+            )
+        db.execute("ANALYZE")
+    return start
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
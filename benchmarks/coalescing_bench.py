@@ -0,0 +1,117 @@
+"""
+Upstream LLM calls and parse latency for bursts of identical messages
+
+Simulates a promotion: every kiosk sends one of a few phrases at the same moment.
+Runs the burst with and without single-flight coalescing against an in-process stub
+client, with the intent cache disabled so only coalescing can deduplicate. A failing
+stub checks that followers share the leader's fallback outcome.
+
+Usage:
+    python -m benchmarks.coalescing_bench --kiosks 500 --phrases 5 --llm-delay 0.3
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from benchmarks._common import summarize
+
+os.environ["INTENT_CACHE_SIZE"] = "0"
+os.environ.setdefault("OPENAI_API_KEY", "dummy-key-for-testing")
+
+from app import ai_parser  # noqa: E402
+
+PRODUCTS = ("coke", "pepsi", "sprite", "fanta", "mountain dew", "dr pepper")
+PHRASES = ["buy a coke", "I want 2 sprites", "give me a fanta", "can I get a pepsi", "buy 3 dr peppers",
+           "what do you have?", "I'd like a mountain dew", "buy 2 cokes"]
+
+
+class _CountingCompletions:
+    def __init__(self, delay: float, retries: int, fail: bool):
+        self.delay = delay
+        self.retries = retries
+        self.fail = fail
+        self.calls = 0
+
+    async def create(self, response_model, messages, **kwargs):
+        self.calls += 1
+        # Each retry Instructor makes is another round trip
+        await asyncio.sleep(self.delay * (1 + self.retries))
+        if self.fail:
+            raise RuntimeError("upstream unavailable")
+        return response_model._enhanced_fallback_parse(messages[-1]["content"], list(PRODUCTS))
+
+
+class CountingLLMClient:
+    def __init__(self, delay: float, retries: int = 0, fail: bool = False):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = _CountingCompletions(delay, retries, fail)
+
+
+class _NoCoalescing:
+    leaders = followers = 0
+
+    def in_flight(self) -> int:
+        return 0
+
+    async def do(self, key, call):
+        return await call()
+
+
+async def _burst(kiosks: int, phrases: int, jitter: float, seed: int):
+    rng = random.Random(seed)
+    latencies, intents = [], []
+
+    async def kiosk(message: str):
+        await asyncio.sleep(rng.uniform(0, jitter))
+        started = time.perf_counter()
+        intents.append((message, await ai_parser.parse_purchase_request(message, PRODUCTS)))
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(kiosk(rng.choice(PHRASES[:phrases])) for _ in range(kiosks)))
+    return latencies, intents, time.perf_counter() - started
+
+
+async def run(kiosks: int, phrases: int, llm_delay: float, retries: int, jitter: float) -> dict:
+    results = {}
+    for mode, flights in (("independent", _NoCoalescing()), ("coalesced", ai_parser.SingleFlight())):
+        ai_parser.parse_flights = flights
+        ai_parser.client = CountingLLMClient(llm_delay, retries)
+        latencies, _, elapsed = await _burst(kiosks, phrases, jitter, seed=1)
+        results[mode] = {
+            "upstream_calls": ai_parser.client.chat.completions.calls,
+            "upstream_calls_per_sec": round(ai_parser.client.chat.completions.calls / elapsed, 1),
+            "followers": flights.followers,
+            "latency": summarize(latencies),
+        }
+
+    # Upstream down: one failed call per phrase, and every follower gets the same fallback intent
+    ai_parser.parse_flights = ai_parser.SingleFlight()
+    ai_parser.client = CountingLLMClient(llm_delay, fail=True)
+    _, intents, _ = await _burst(kiosks, phrases, 0.0, seed=2)
+    failed_calls = ai_parser.client.chat.completions.calls
+    distinct = {message for message, _ in intents}
+    assert failed_calls == len(distinct), f"{failed_calls} upstream calls for {len(distinct)} distinct phrases"
+    for message, intent in intents:
+        assert intent == ai_parser.PurchaseIntent._enhanced_fallback_parse(message, list(PRODUCTS)), message
+    results["upstream_failure"] = {"upstream_calls": failed_calls, "requests": len(intents), "all_fell_back": True}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kiosks", type=int, default=500, help="concurrent requests in the burst")
+    parser.add_argument("--phrases", type=int, default=5, help=f"distinct phrases in the burst (max {len(PHRASES)})")
+    parser.add_argument("--llm-delay", type=float, default=0.3, help="seconds per upstream round trip")
+    parser.add_argument("--retries", type=int, default=0, help="extra round trips per upstream call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="spread of arrival times in seconds")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.kiosks, min(args.phrases, len(PHRASES)), args.llm_delay,
+                                     args.retries, args.jitter)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
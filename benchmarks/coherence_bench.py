@@ -0,0 +1,154 @@
+"""
+Cross-worker staleness of /inventory with the DB catalog version check
+
+Two uvicorn processes share one SQLite file. Each purchase goes to worker A, then
+worker B's /inventory is polled until it shows the stock A returned. Machine-scoped
+purchases on A are timed the same way against B's /inventory/stream for that machine.
+With CATALOG_SYNC_INTERVAL_MS=0 (checks off) B never catches up and the sample counts
+as stale; with checks on, staleness must stay within the interval plus --slack-ms.
+
+Usage:
+    python -m benchmarks.coherence_bench --intervals-ms 0 100 500 --purchases 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+from benchmarks._common import summarize
+from benchmarks.load_test import REPO_ROOT, _free_port, _start_server, _stop, _wait_ready
+
+PRODUCTS = ["coke", "pepsi", "sprite", "fanta"]
+
+
+async def _staleness(client, url: str, product: str, stock: int, timeout: float) -> Optional[float]:
+    """Seconds until the other worker's /inventory shows this stock, or None on timeout"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        inventory = (await client.get(url)).json()
+        if next(row["stock"] for row in inventory if row["name"] == product) == stock:
+            return time.perf_counter() - started
+        await asyncio.sleep(0.005)
+    return None
+
+
+async def _next_event(lines) -> dict:
+    event = {}
+    async for line in lines:
+        if not line:
+            if "data" in event:
+                return event
+            event = {}
+            continue
+        field, _, value = line.partition(": ")
+        event[field] = value
+    raise RuntimeError("stream ended")
+
+
+async def _feed_staleness(client, seller: str, watcher: str, purchases: int, interval_ms: float, timeout: float,
+                          rng) -> Tuple[List[float], int]:
+    """Seconds from each machine purchase on the seller until the watcher's stream for that machine shows it"""
+    product = PRODUCTS[0]
+    product_id = next(row["id"] for row in (await client.get(seller + "/api/v1/inventory")).json() if row["name"] == product)
+    machine_id = (await client.post(seller + "/api/v1/machines", json={"name": "coherence"})).json()["id"]
+    await client.post(seller + f"/api/v1/machines/{machine_id}/restock", json={"items": {product: purchases}})
+    samples: List[float] = []
+    async with client.stream("GET", watcher + f"/api/v1/inventory/stream?machine_id={machine_id}") as stream:
+        lines = stream.aiter_lines()
+        await _next_event(lines)
+        for _ in range(purchases):
+            await asyncio.sleep(rng.uniform(0, interval_ms / 1000))
+            started = time.perf_counter()
+            body = (await client.post(seller + f"/api/v1/purchase?machine_id={machine_id}",
+                                      json={"message": f"buy a {product}"})).json()
+            assert body["success"], body
+            wanted = {"id": product_id, "stock": body["remaining_stock"]}
+            try:
+                while wanted not in json.loads((await asyncio.wait_for(
+                    _next_event(lines), max(timeout - (time.perf_counter() - started), 0.001)
+                ))["data"])["products"]:
+                    pass
+            except asyncio.TimeoutError:
+                # The stream cannot catch up without checks; every later sale is stale as well
+                break
+            samples.append(time.perf_counter() - started)
+    return samples, purchases - len(samples)
+
+
+async def _case(interval_ms: float, purchases: int, slack_ms: float, stale_timeout: float) -> dict:
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix="soda-coherence-")
+    path = os.path.join(workdir, "coherence.db")
+    subprocess.run([sys.executable, "-m", "benchmarks.load_test", "--prepare", path, "--rows", "0"],
+                   cwd=REPO_ROOT, check=True)
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{path}",
+        "DEBUG": "false",
+        "PARSE_MODE": "cascade",
+        "OPENAI_API_KEY": "dummy-key-for-testing",
+        "CATALOG_SYNC_INTERVAL_MS": str(interval_ms),
+    }
+    ports = [_free_port(), _free_port()]
+    workers = [_start_server("app.main:app", port, env) for port in ports]
+    seller, watcher = (f"http://127.0.0.1:{port}" for port in ports)
+    samples, stale = [], 0
+    rng = random.Random(5)
+    timeout = stale_timeout if interval_ms <= 0 else interval_ms / 1000 + stale_timeout
+    try:
+        for worker, base_url in zip(workers, (seller, watcher)):
+            await _wait_ready(base_url + "/api/v1/inventory", worker)
+        async with httpx.AsyncClient(timeout=30) as client:
+            for i in range(purchases):
+                # Random phase against the check timer, or every sample would land just after a check
+                await asyncio.sleep(rng.uniform(0, interval_ms / 1000))
+                product = PRODUCTS[i % len(PRODUCTS)]
+                body = (await client.post(seller + "/api/v1/purchase", json={"message": f"buy a {product}"})).json()
+                assert body["success"], body
+                seconds = await _staleness(client, watcher + "/api/v1/inventory", product, body["remaining_stock"], timeout)
+                if seconds is None:
+                    stale += 1
+                else:
+                    samples.append(seconds)
+            feed_samples, feed_stale = await _feed_staleness(client, seller, watcher, purchases, interval_ms, timeout, rng)
+    finally:
+        for worker in workers:
+            _stop(worker)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "interval_ms": interval_ms, "purchases": purchases, "stale": stale, "staleness": summarize(samples),
+        "machine_feed_stale": feed_stale, "machine_feed_staleness": summarize(feed_samples),
+    }
+    if interval_ms > 0:
+        assert stale == 0 and feed_stale == 0, result
+        assert result["staleness"]["max_ms"] <= interval_ms + slack_ms, result
+        assert result["machine_feed_staleness"]["max_ms"] <= interval_ms + slack_ms, result
+    return result
+
+
+async def run(intervals_ms, purchases: int, slack_ms: float, stale_timeout: float) -> list:
+    return [await _case(interval, purchases, slack_ms, stale_timeout) for interval in intervals_ms]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--intervals-ms", type=float, nargs="+", default=[0, 100, 500],
+                        help="CATALOG_SYNC_INTERVAL_MS values (0 turns the checks off)")
+    parser.add_argument("--purchases", type=int, default=30)
+    parser.add_argument("--slack-ms", type=float, default=100, help="allowed staleness beyond the interval")
+    parser.add_argument("--stale-timeout", type=float, default=2, help="seconds before a sample counts as stale")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.intervals_ms, args.purchases, args.slack_ms, args.stale_timeout)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Concurrency benchmark: /inventory latency while purchases wait on a slow LLM
+
+Usage:
+    python -m benchmarks.concurrency_bench --purchases 200 --llm-delay 0.5
+    python -m benchmarks.concurrency_bench --blocking   # simulate a sync LLM client
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks._common import use_temp_database, summarize
+
+use_temp_database()
+
+import httpx  # noqa: E402
+
+from app import ai_parser  # noqa: E402
+from app.database import create_db_and_tables  # noqa: E402
+from app.main import app  # noqa: E402
+from app.seed_data import seed_products  # noqa: E402
+
+
+class _StubCompletions:
+    def __init__(self, delay: float, blocking: bool):
+        self.delay = delay
+        self.blocking = blocking
+
+    async def create(self, response_model, messages, **kwargs):
+        if self.blocking:
+            time.sleep(self.delay)
+        else:
+            await asyncio.sleep(self.delay)
+        products = [p.strip() for p in messages[0]["content"].split("Available products:")[1].splitlines()[0].split(",")]
+        return response_model._enhanced_fallback_parse(messages[-1]["content"], products)
+
+
+class StubLLMClient:
+    """Stand-in for the Instructor client with a fixed response latency"""
+
+    def __init__(self, delay: float, blocking: bool = False):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = _StubCompletions(delay, blocking)
+
+
+async def _sample_inventory(client: httpx.AsyncClient, samples: int, interval: float):
+    latencies = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        response = await client.get("/api/v1/inventory")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run(purchases: int, llm_delay: float, blocking: bool, samples: int) -> dict:
+    create_db_and_tables()
+    seed_products()
+    ai_parser.client = StubLLMClient(llm_delay, blocking)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        idle = await _sample_inventory(client, samples, 0.005)
+
+        started = time.perf_counter()
+        purchase_tasks = [
+            asyncio.create_task(client.post("/api/v1/purchase", json={"message": "buy a coke"}))
+            for _ in range(purchases)
+        ]
+        await asyncio.sleep(0)
+        loaded = await _sample_inventory(client, samples, 0.005)
+        responses = await asyncio.gather(*purchase_tasks)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "purchases": purchases,
+        "llm_delay_s": llm_delay,
+        "blocking_llm": blocking,
+        "purchases_succeeded": sum(1 for r in responses if r.json()["success"]),
+        "purchase_wall_s": round(elapsed, 3),
+        "inventory_idle": summarize(idle),
+        "inventory_under_load": summarize(loaded),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=200)
+    parser.add_argument("--llm-delay", type=float, default=0.5)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--blocking", action="store_true", help="stub blocks the event loop like a sync client")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.purchases, args.llm_delay, args.blocking, args.samples)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Multi-process purchase contention: many workers buying a small stock at once
+
+Each worker process runs its own copy of the app (as a uvicorn worker would) against
+the same SQLite file. The run fails if any unit is oversold or the ledger disagrees
+with the stock column.
+
+Usage:
+    python -m benchmarks.contention_bench --workers 4 --purchases 2000 --stock 100
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+
+from benchmarks._common import summarize, use_temp_database
+
+
+def _worker(database_url: str, purchases: int, concurrency: int, queue):
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("DEBUG", "false")
+
+    import httpx
+    from app.main import app
+
+    async def run():
+        await app.router.startup()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, outcomes = [], {"sold": 0, "rejected": 0, "errors": 0}
+
+        async def buy(client):
+            async with semaphore:
+                started = time.perf_counter()
+                body = (await client.post("/api/v1/purchase", json={"message": "buy 1 coke"})).json()
+                latencies.append(time.perf_counter() - started)
+                if body["success"]:
+                    outcomes["sold"] += 1
+                elif body["message"].startswith("Sorry, only"):
+                    outcomes["rejected"] += 1
+                else:
+                    outcomes["errors"] += 1
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(buy(client) for _ in range(purchases)))
+            elapsed = time.perf_counter() - started
+        return {**outcomes, "elapsed_s": elapsed, "latencies": latencies}
+
+    queue.put(asyncio.run(run()))
+
+
+def run(workers: int, purchases: int, stock: int, concurrency: int) -> dict:
+    path = use_temp_database("contention.db")
+    database_url = os.environ["DATABASE_URL"]
+
+    from app.database import create_db_and_tables
+    from app.seed_data import seed_products
+
+    create_db_and_tables()
+    seed_products()
+    with sqlite3.connect(path) as db:
+        db.execute("UPDATE product SET stock = ? WHERE name = 'coke'", (stock,))
+
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    per_worker = purchases // workers
+    processes = [
+        context.Process(target=_worker, args=(database_url, per_worker, concurrency, queue))
+        for _ in range(workers)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    wall = time.perf_counter() - started
+
+    with sqlite3.connect(path) as db:
+        final_stock = db.execute("SELECT stock FROM product WHERE name = 'coke'").fetchone()[0]
+        ledger_units = db.execute(
+            "SELECT COALESCE(SUM(t.quantity), 0) FROM \"transaction\" t JOIN product p ON p.id = t.product_id "
+            "WHERE p.name = 'coke'"
+        ).fetchone()[0]
+
+    sold = sum(r["sold"] for r in results)
+    report = {
+        "workers": workers,
+        "purchases": per_worker * workers,
+        "initial_stock": stock,
+        "sold": sold,
+        "rejected": sum(r["rejected"] for r in results),
+        "errors": sum(r["errors"] for r in results),
+        "final_stock": final_stock,
+        "ledger_units": ledger_units,
+        "oversold": max(0, sold - stock),
+        "wall_s": round(wall, 3),
+        "requests_per_sec_by_worker": [round(per_worker / r["elapsed_s"]) for r in results],
+        "latency": summarize([latency for r in results for latency in r["latencies"]]),
+    }
+    assert final_stock >= 0, report
+    assert sold <= stock, report
+    assert ledger_units == stock - final_stock == sold, report
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--purchases", type=int, default=2000)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50, help="in-flight requests per worker")
+    args = parser.parse_args()
+    print(json.dumps(run(args.workers, args.purchases, args.stock, args.concurrency), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Read latency under a concurrent purchase write load, per engine profile
+
+Each profile runs in its own process because engines are built at import time.
+Purchases come from separate worker processes, as they would under several uvicorn
+workers, while this process measures GET latency.
+
+Usage:
+    python -m benchmarks.engine_profiles_bench --profiles legacy production --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from benchmarks._common import summarize, use_temp_database
+
+
+async def _write_load(seconds: float, writers: int) -> dict:
+    import httpx
+    from app.main import app
+
+    await app.router.startup()
+    deadline = time.perf_counter() + seconds
+    writes = {"ok": 0, "failed": 0}
+
+    async def writer(client):
+        while time.perf_counter() < deadline:
+            body = (await client.post("/api/v1/purchase", json={"message": "buy 1 coke"})).json()
+            writes["ok" if body["success"] else "failed"] += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        await asyncio.gather(*(writer(client) for _ in range(writers)))
+    return writes
+
+
+def _writer_process(seconds: float, writers: int, queue):
+    queue.put(asyncio.run(_write_load(seconds, writers)))
+
+
+async def _read_load(seconds: float, readers: int) -> dict:
+    import httpx
+    from app.main import app
+
+    await app.router.startup()
+    deadline = time.perf_counter() + seconds
+    reads = {"inventory": [], "transactions": []}
+
+    async def reader(client, path, samples):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            (await client.get(path)).raise_for_status()
+            samples.append(time.perf_counter() - started)
+            await asyncio.sleep(0.005)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        tasks = []
+        for _ in range(readers):
+            tasks.append(reader(client, "/api/v1/inventory", reads["inventory"]))
+            tasks.append(reader(client, "/api/v1/transactions?limit=50", reads["transactions"]))
+        await asyncio.gather(*tasks)
+    return reads
+
+
+def _child(seconds: float, write_workers: int, writers: int, readers: int):
+    """One profile: purchase load in separate worker processes, reads measured in this one"""
+    path = use_temp_database("profiles.db")
+    from app.database import create_db_and_tables
+    from app.seed_data import seed_products
+
+    create_db_and_tables()
+    seed_products()
+    with sqlite3.connect(path) as db:
+        db.execute("UPDATE product SET stock = 1000000000")
+
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    processes = [
+        context.Process(target=_writer_process, args=(seconds, writers, queue)) for _ in range(write_workers)
+    ]
+    for process in processes:
+        process.start()
+    reads = asyncio.run(_read_load(seconds, readers))
+    writes = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    print(json.dumps({
+        "profile": os.environ["DB_PROFILE"],
+        "purchases_per_sec": round(sum(w["ok"] for w in writes) / seconds, 1),
+        "failed_purchases": sum(w["failed"] for w in writes),
+        "inventory": summarize(reads["inventory"]),
+        "transactions": summarize(reads["transactions"]),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=["legacy", "production"])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-workers", type=int, default=2, help="processes generating purchases")
+    parser.add_argument("--writers", type=int, default=20, help="concurrent purchases per write worker")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.seconds, args.write_workers, args.writers, args.readers)
+        return
+
+    results = []
+    for profile in args.profiles:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.engine_profiles_bench", "--child",
+             "--seconds", str(args.seconds), "--write-workers", str(args.write_workers),
+             "--writers", str(args.writers), "--readers", str(args.readers)],
+            env={**os.environ, "DB_PROFILE": profile},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
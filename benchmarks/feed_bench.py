@@ -0,0 +1,216 @@
+"""
+Thousands of inventory subscribers on one worker: SSE change feed vs. polling /inventory
+
+Starts one uvicorn worker on a fresh database and measures, from the server's own
+/proc counters:
+  feed      N idle /inventory/stream subscribers: connect time, server RSS and CPU while
+            idle, then the latency until every subscriber has the delta of each purchase
+  polling   the same N clients polling /inventory with If-None-Match every --poll-interval
+            seconds: server CPU and request rate for the same idle period
+Every subscriber must receive every delta, and a reconnect with Last-Event-ID must resume
+without a snapshot.
+
+Usage:
+    python -m benchmarks.feed_bench --subscribers 2000 --idle-seconds 20 --purchases 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from benchmarks._common import summarize
+from benchmarks.load_test import _free_port, _start_server, _stop, _wait_ready
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def _server_usage(pid: int) -> Dict[str, float]:
+    """CPU seconds and resident memory of the server process"""
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    with open(f"/proc/{pid}/status") as status:
+        rss_kb = next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+    return {"cpu_s": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, "rss_mb": rss_kb / 1024}
+
+
+def _request(path: str, headers: Optional[Dict[str, str]] = None) -> bytes:
+    lines = [f"GET {path} HTTP/1.1", "Host: bench"] + [f"{k}: {v}" for k, v in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+class Subscriber:
+    """One raw-socket SSE client that records when each delta arrives"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.deltas: List[float] = []
+        self.snapshots = 0
+        self.last_event_id: Optional[str] = None
+        self.ready = asyncio.Event()
+        self._writer = None
+
+    async def run(self, path: str, headers: Optional[Dict[str, str]] = None):
+        reader, self._writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self._writer.write(_request(path, headers))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                if line.startswith(b"id: "):
+                    self.last_event_id = line[4:].strip().decode()
+                elif line.startswith(b"event: snapshot"):
+                    self.snapshots += 1
+                    self.ready.set()
+                elif line.startswith(b"event: delta"):
+                    self.deltas.append(time.perf_counter())
+                    self.ready.set()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._writer.close()
+
+
+async def _poll(port: int, interval: float, until: float, counter: List[int], offset: float):
+    """Keep-alive client polling /inventory with If-None-Match, as kiosks do today"""
+    await asyncio.sleep(offset)
+    writer, etag = None, None
+    while time.perf_counter() < until:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(_request("/api/v1/inventory", {"If-None-Match": etag} if etag else None))
+            length = 0
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionResetError
+                if line == b"\r\n":
+                    break
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+                elif name.lower() == "etag":
+                    etag = value.strip()
+            await reader.readexactly(length)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The server closed an idle keep-alive connection; reconnect and ask again
+            writer.close()
+            writer = None
+            continue
+        counter[0] += 1
+        await asyncio.sleep(interval)
+    if writer is not None:
+        writer.close()
+
+
+async def _purchase(base_url: str, client) -> float:
+    sent = time.perf_counter()
+    response = await client.post(base_url + "/api/v1/purchase", json={"message": "buy a coke"})
+    assert response.json()["success"], response.json()
+    return sent
+
+
+async def run(subscribers: int, idle_seconds: float, purchases: int, poll_interval: float) -> dict:
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix="soda-feed-")
+    db_path = os.path.join(workdir, "feed.db")
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "DEBUG": "false",
+        "PARSE_MODE": "cascade",
+        "OPENAI_API_KEY": "dummy-key-for-testing",
+        "INVENTORY_FEED_HEARTBEAT": "15",
+    }
+    server = _start_server("app.main:app", port, env)
+    report = {"subscribers": subscribers}
+    try:
+        await _wait_ready(base_url + "/api/v1/inventory", server)
+        db = sqlite3.connect(db_path)
+        db.execute("UPDATE product SET stock = 1000000")
+        db.commit()
+        db.close()
+        baseline = _server_usage(server.pid)
+
+        # Feed: connect everyone, wait for their snapshots, then sit idle
+        clients = [Subscriber(port) for _ in range(subscribers)]
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(client.run("/api/v1/inventory/stream")) for client in clients]
+        await asyncio.gather(*(client.ready.wait() for client in clients))
+        connected = time.perf_counter() - started
+        idle_start = _server_usage(server.pid)
+        await asyncio.sleep(idle_seconds)
+        idle_end = _server_usage(server.pid)
+
+        # Fan-out: one purchase at a time, until every subscriber has its delta
+        latencies = []
+        async with httpx.AsyncClient(timeout=60) as http:
+            for i in range(purchases):
+                sent = await _purchase(base_url, http)
+                while any(len(client.deltas) <= i for client in clients):
+                    await asyncio.sleep(0.001)
+                latencies.append(max(client.deltas[i] for client in clients) - sent)
+
+            # Reconnect one subscriber with its last event id while a purchase happens in between
+            resumed = Subscriber(port)
+            last_event_id = clients[0].last_event_id
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks)
+            await _purchase(base_url, http)
+            resume_task = asyncio.ensure_future(
+                resumed.run("/api/v1/inventory/stream", {"Last-Event-ID": last_event_id})
+            )
+            await asyncio.wait_for(resumed.ready.wait(), 10)
+            resume_task.cancel()
+            await resume_task
+        assert all(len(client.deltas) == purchases and client.snapshots == 1 for client in clients)
+        assert resumed.snapshots == 0 and len(resumed.deltas) == 1, "Last-Event-ID resume fell back to a snapshot"
+
+        report["feed"] = {
+            "connect_all_s": round(connected, 2),
+            "server_rss_mb": round(idle_start["rss_mb"], 1),
+            "rss_per_subscriber_kb": round((idle_start["rss_mb"] - baseline["rss_mb"]) * 1024 / subscribers, 1),
+            "idle_cpu_percent": round(100 * (idle_end["cpu_s"] - idle_start["cpu_s"]) / idle_seconds, 2),
+            "fanout_to_all": summarize(latencies),
+        }
+
+        # Polling: the same clients asking for /inventory on a timer instead
+        await asyncio.sleep(1)
+        counter = [0]
+        poll_start = _server_usage(server.pid)
+        until = time.perf_counter() + idle_seconds
+        await asyncio.gather(*(
+            _poll(port, poll_interval, until, counter, poll_interval * i / subscribers) for i in range(subscribers)
+        ))
+        poll_end = _server_usage(server.pid)
+        report["polling"] = {
+            "interval_s": poll_interval,
+            "requests_per_s": round(counter[0] / idle_seconds, 1),
+            "idle_cpu_percent": round(100 * (poll_end["cpu_s"] - poll_start["cpu_s"]) / idle_seconds, 2),
+        }
+    finally:
+        _stop(server)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=2000)
+    parser.add_argument("--idle-seconds", type=float, default=20)
+    parser.add_argument("--purchases", type=int, default=20)
+    parser.add_argument("--poll-interval", type=float, default=5, help="seconds between polls per client")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.subscribers, args.idle_seconds, args.purchases, args.poll_interval)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
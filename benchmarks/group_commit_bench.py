@@ -0,0 +1,112 @@
+"""
+Sales/sec with one commit per purchase vs. group commit
+
+Each case runs in a fresh process with its own database, since the DB profile and the
+group commit size are read at import. Purchases use the local parser (no LLM), so the
+write path dominates. Every case checks that the ledger, the rollups and the stock
+column agree afterwards.
+
+Usage:
+    python -m benchmarks.group_commit_bench --purchases 3000 --concurrency 64
+    python -m benchmarks.group_commit_bench --profiles legacy development --batch-sizes 1 16 64
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks._common import summarize
+
+INITIAL_STOCK = 1_000_000
+MESSAGES = ["buy a coke", "buy 2 pepsi", "buy a sprite", "buy a fanta", "buy 2 cokes"]
+
+
+def _case(profile: str, batch_size: int, wait_ms: float, purchases: int, concurrency: int, queue):
+    path = os.path.join(tempfile.mkdtemp(prefix="soda-group-commit-"), "bench.db")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{path}",
+        "DEBUG": "false",
+        "OPENAI_API_KEY": "dummy-key-for-testing",
+        "DB_PROFILE": profile,
+        "GROUP_COMMIT_MAX_SIZE": str(batch_size),
+        "GROUP_COMMIT_MAX_WAIT_MS": str(wait_ms),
+    })
+
+    import httpx
+    from app.catalog import catalog
+    from app.group_commit import ledger
+    from app.main import app
+
+    async def run():
+        await app.router.startup()
+        db = sqlite3.connect(path)
+        db.execute("UPDATE product SET stock = ?", (INITIAL_STOCK,))
+        db.commit()
+        db.close()
+        catalog.invalidate()
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, sold = [], 0
+
+        async def buy(client, i):
+            nonlocal sold
+            async with semaphore:
+                started = time.perf_counter()
+                body = (await client.post("/api/v1/purchase", json={"message": MESSAGES[i % len(MESSAGES)]})).json()
+                latencies.append(time.perf_counter() - started)
+                sold += body["success"]
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(buy(client, i) for i in range(purchases)))
+            elapsed = time.perf_counter() - started
+        await ledger.close()
+
+        db = sqlite3.connect(path)
+        ledger_rows, ledger_units = db.execute('SELECT COUNT(*), SUM(quantity) FROM "transaction"').fetchone()
+        stock_units = db.execute("SELECT SUM(? - stock) FROM product", (INITIAL_STOCK,)).fetchone()[0]
+        rollup_units, rollup_count = db.execute("SELECT SUM(units), SUM(transactions) FROM productsalestotal").fetchone()
+        db.close()
+        assert sold == purchases == ledger_rows == rollup_count, (sold, purchases, ledger_rows, rollup_count)
+        assert ledger_units == stock_units == rollup_units, (ledger_units, stock_units, rollup_units)
+        return {
+            "profile": profile,
+            "group_commit_max_size": batch_size,
+            "sales_per_s": round(sold / elapsed, 1),
+            "write_transactions": ledger.batches if ledger.enabled else sold,
+            "latency": summarize(latencies),
+        }
+
+    queue.put(asyncio.run(run()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=["legacy", "development"], help="DB_PROFILE values")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64], help="GROUP_COMMIT_MAX_SIZE values")
+    parser.add_argument("--wait-ms", type=float, default=2.0, help="GROUP_COMMIT_MAX_WAIT_MS")
+    parser.add_argument("--purchases", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=64, help="purchases in flight at once")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for profile in args.profiles:
+        for batch_size in args.batch_sizes:
+            queue = context.Queue()
+            process = context.Process(
+                target=_case, args=(profile, batch_size, args.wait_ms, args.purchases, args.concurrency, queue)
+            )
+            process.start()
+            results.append(queue.get())
+            process.join()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
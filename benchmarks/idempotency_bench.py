@@ -0,0 +1,120 @@
+"""
+Duplicate work and duplicate ledger rows from kiosk retries, with and without Idempotency-Key
+
+Every kiosk makes one purchase. A share of them time out and resend it while the
+original is still in flight, and some resend it again after it completed. Without keys
+each copy is parsed and sold; with keys the copies join or replay the original. Runs
+in-process against a stub LLM client with the intent cache off.
+
+Usage:
+    python -m benchmarks.idempotency_bench --kiosks 200 --retry-rate 0.3 --llm-delay 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+import uuid
+
+from benchmarks._common import summarize, use_temp_database
+
+DB_PATH = use_temp_database()
+os.environ["INTENT_CACHE_SIZE"] = "0"
+
+import httpx  # noqa: E402
+
+from app import ai_parser  # noqa: E402
+from app.catalog import catalog  # noqa: E402
+from app.main import app  # noqa: E402
+from benchmarks.coalescing_bench import CountingLLMClient  # noqa: E402
+
+PHRASES = ["buy a coke", "buy 2 sprites", "buy a fanta", "buy a pepsi", "buy 2 dr peppers"]
+
+
+def _ledger() -> tuple:
+    db = sqlite3.connect(DB_PATH)
+    rows, units = db.execute('SELECT COUNT(*), COALESCE(SUM(quantity), 0) FROM "transaction"').fetchone()
+    db.close()
+    return rows, units
+
+
+async def _run_kiosks(client: httpx.AsyncClient, kiosks: int, retry_rate: float, llm_delay: float,
+                      use_keys: bool, seed: int) -> dict:
+    rng = random.Random(seed)
+    latencies, retry_latencies = [], []
+    copies = 0
+
+    async def send(message: str, headers: dict, sink: list):
+        started = time.perf_counter()
+        response = await client.post("/api/v1/purchase", json={"message": message}, headers=headers)
+        response.raise_for_status()
+        sink.append(time.perf_counter() - started)
+
+    async def kiosk():
+        nonlocal copies
+        # Varied wording, so coalescing of identical in-flight messages hides few of the duplicate parses
+        message = f"{rng.choice(PHRASES)} {'please ' * rng.randint(0, 30)}".strip()
+        headers = {"Idempotency-Key": uuid.uuid4().hex} if use_keys else {}
+        sends = [send(message, headers, latencies)]
+        if rng.random() < retry_rate:
+            # Client-side timeout: the resend overlaps the original
+            copies += 1
+            sends.append(_after(rng.uniform(0, llm_delay), send(message, headers, retry_latencies)))
+        await asyncio.gather(*sends)
+        if rng.random() < retry_rate / 2:
+            # Lost response: resent after the original completed
+            copies += 1
+            await send(message, headers, retry_latencies)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(kiosk() for _ in range(kiosks)))
+    return {"elapsed_s": round(time.perf_counter() - started, 3), "copies_sent": copies,
+            "latency": summarize(latencies), "retry_latency": summarize(retry_latencies)}
+
+
+async def _after(delay: float, awaitable):
+    await asyncio.sleep(delay)
+    return await awaitable
+
+
+async def run(kiosks: int, retry_rate: float, llm_delay: float) -> dict:
+    await app.router.startup()
+    db = sqlite3.connect(DB_PATH)
+    db.execute("UPDATE product SET stock = 1000000")
+    db.commit()
+    db.close()
+    catalog.invalidate()
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for mode, use_keys in (("no_keys", False), ("idempotency_keys", True)):
+            ai_parser.client = CountingLLMClient(llm_delay)
+            rows_before, units_before = _ledger()
+            result = await _run_kiosks(client, kiosks, retry_rate, llm_delay, use_keys, seed=11)
+            rows_after, units_after = _ledger()
+            results[mode] = {
+                "purchases": kiosks,
+                "llm_calls": ai_parser.client.chat.completions.calls,
+                "ledger_rows": rows_after - rows_before,
+                "units_sold": units_after - units_before,
+                **result,
+            }
+    assert results["idempotency_keys"]["ledger_rows"] == kiosks, results["idempotency_keys"]
+    assert results["idempotency_keys"]["llm_calls"] < results["no_keys"]["llm_calls"], results
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kiosks", type=int, default=200)
+    parser.add_argument("--retry-rate", type=float, default=0.3, help="share of purchases resent while in flight")
+    parser.add_argument("--llm-delay", type=float, default=0.2, help="seconds per upstream LLM call")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.kiosks, args.retry_rate, args.llm_delay)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Bulk catalog import: set-based upserts vs. row-by-row ORM writes
+
+Posts a generated CSV of --rows products to POST /api/v1/catalog/import three times:
+  create    every product is new
+  restock   every product gets stock added (mode=add)
+  no-op     the same file with mode=set and the levels just written, so nothing changes
+plus a machine restock of --machine-rows (machine, product) rows. For comparison the
+same number of new products is written the way seed_products does it, one ORM object
+per row, and then restocked with a select and an update per row. Every phase checks
+the resulting rows, and the create and restock imports must finish within --max-seconds.
+
+Usage:
+    python -m benchmarks.import_bench --rows 10000 --machine-rows 10000
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import time
+
+from benchmarks._common import use_temp_database
+
+DB_PATH = use_temp_database()
+
+import httpx  # noqa: E402
+from sqlmodel import Session, select  # noqa: E402
+
+from app.database import engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Product  # noqa: E402
+
+MACHINES = 100
+
+
+def _csv(rows, columns) -> str:
+    return "\n".join([",".join(columns)] + [",".join(str(value) for value in row) for row in rows]) + "\n"
+
+
+def _row_by_row(count: int, stock: int) -> dict:
+    """New products one ORM object at a time, then a select and update per product"""
+    names = [f"orm product {i}" for i in range(count)]
+    started = time.perf_counter()
+    with Session(engine) as session:
+        for name in names:
+            session.add(Product(name=name, price=1.25, stock=stock, category="bench"))
+        session.commit()
+    created = time.perf_counter() - started
+    started = time.perf_counter()
+    with Session(engine) as session:
+        for name in names:
+            product = session.exec(select(Product).where(Product.name == name)).one()
+            product.stock += stock
+            session.add(product)
+        session.commit()
+    return {"create_s": round(created, 3), "restock_s": round(time.perf_counter() - started, 3)}
+
+
+async def _post(client: httpx.AsyncClient, body: str, params: dict) -> dict:
+    started = time.perf_counter()
+    response = await client.post("/api/v1/catalog/import", content=body, params=params,
+                                 headers={"content-type": "text/csv"})
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.text[:500]
+    summary = response.json()
+    return {"seconds": round(elapsed, 3), **{key: summary[key] for key in (
+        "rows", "products_created", "products_updated", "products_unchanged", "stock_delta", "machine_stock_rows"
+    )}}
+
+
+async def run(rows: int, machine_rows: int, max_seconds: float) -> dict:
+    await app.router.startup()
+    db = sqlite3.connect(DB_PATH)
+    db.executemany("INSERT INTO machine (id, name, created_at) VALUES (?, ?, datetime('now'))",
+                   [(i, f"machine-{i}") for i in range(1, MACHINES + 1)])
+    db.commit()
+    db.close()
+
+    rng = random.Random(9)
+    names = [f"bench product {i}" for i in range(rows)]
+    create = _csv(
+        ((name, round(rng.uniform(0.5, 3), 2), 10, f"Synthetic product {i}", "bench") for i, name in enumerate(names)),
+        ("name", "price", "stock", "description", "category"),
+    )
+    restock = _csv(((name, 5) for name in names), ("name", "stock"))
+    levels = _csv(((name, 15) for name in names), ("name", "stock"))
+    pairs = rng.sample([(m, name) for m in range(1, MACHINES + 1) for name in names[:max(1, machine_rows // 10)]],
+                       min(machine_rows, MACHINES * max(1, machine_rows // 10)))
+    machine_stock = _csv(((name, 24, machine_id) for machine_id, name in pairs), ("name", "stock", "machine_id"))
+
+    report = {"rows": rows}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        report["create"] = await _post(client, create, {})
+        report["restock"] = await _post(client, restock, {"mode": "add"})
+        report["no_op"] = await _post(client, levels, {"mode": "set"})
+        report["machine_restock"] = await _post(client, machine_stock, {"mode": "add"})
+    report["row_by_row"] = _row_by_row(rows, 10)
+
+    db = sqlite3.connect(DB_PATH)
+    count, total = db.execute("SELECT COUNT(*), SUM(stock) FROM product WHERE category = 'bench' AND name LIKE 'bench%'").fetchone()
+    machine_total = db.execute("SELECT COUNT(*), SUM(stock) FROM machinestock").fetchone()
+    db.close()
+    assert report["create"]["products_created"] == rows and report["restock"]["products_updated"] == rows
+    assert report["no_op"]["products_unchanged"] == rows and report["no_op"]["stock_delta"] == 0
+    assert (count, total) == (rows, rows * 15), (count, total)
+    assert machine_total == (len(pairs), len(pairs) * 24), machine_total
+    assert report["create"]["seconds"] < max_seconds and report["restock"]["seconds"] < max_seconds, report
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--machine-rows", type=int, default=10000)
+    parser.add_argument("--max-seconds", type=float, default=1.0, help="budget for the create and restock imports")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.rows, args.machine_rows, args.max_seconds)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Offline evaluation of the intent parsing tiers on a labelled message corpus
+
+Scores the local parser, the LLM (when OPENAI_API_KEY/OPENAI_BASE_URL point at a
+model) and the cascade that combines them, and reports how often the tiers agree.
+A threshold sweep shows how much traffic the local tier would answer on its own and
+how accurate those answers are, to pick CASCADE_CONFIDENCE_THRESHOLD.
+
+Usage:
+    python -m benchmarks.intent_eval
+    python -m benchmarks.intent_eval --threshold 0.8 --show-errors
+    OPENAI_API_KEY=... OPENAI_BASE_URL=... python -m benchmarks.intent_eval --llm
+"""
+import argparse
+import asyncio
+import json
+import os
+from collections import Counter
+from typing import Dict, List, Optional
+
+os.environ["INTENT_CACHE_SIZE"] = "0"
+
+from app import ai_parser  # noqa: E402
+from app.ai_parser import PurchaseIntent, escalation_reason  # noqa: E402
+from app.metrics import LLM_FALLBACKS  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intent_corpus.jsonl")
+SEED_PRODUCTS = ["coke", "pepsi", "sprite", "fanta", "mountain dew", "dr pepper"]
+SWEEP = [0.3, 0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
+
+
+def load_corpus(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _items(intent: PurchaseIntent) -> List[List]:
+    return [[item.product_name, item.quantity] for item in intent.line_items()]
+
+
+def is_correct(label: dict, intent: PurchaseIntent) -> bool:
+    """Intent must match; purchases must also get every product and quantity right"""
+    if intent.intent.value != label["intent"]:
+        return False
+    if label["intent"] != "purchase":
+        return True
+    expected = label.get("items") or ([[label["product"], label["quantity"]]] if label["product"] else [])
+    return _items(intent) == expected
+
+
+def agree(a: PurchaseIntent, b: PurchaseIntent) -> bool:
+    if a.intent != b.intent:
+        return False
+    return a.intent.value != "purchase" or _items(a) == _items(b)
+
+
+def _rate(numerator: int, denominator: int) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator else None
+
+
+async def evaluate(corpus: List[dict], products: List[str], threshold: float, use_llm: bool) -> dict:
+    local = [PurchaseIntent._enhanced_fallback_parse(row["message"], products) for row in corpus]
+    reasons = [escalation_reason(intent, products, threshold) for intent in local]
+    accepted = [i for i, reason in enumerate(reasons) if reason is None]
+
+    report: Dict = {
+        "messages": len(corpus),
+        "threshold": threshold,
+        "local": {
+            "accuracy": _rate(sum(is_correct(row, p) for row, p in zip(corpus, local)), len(corpus)),
+            "accepted": len(accepted),
+            "escalation_rate": _rate(len(corpus) - len(accepted), len(corpus)),
+            "escalation_reasons": dict(Counter(reason for reason in reasons if reason)),
+            "accepted_accuracy": _rate(sum(is_correct(corpus[i], local[i]) for i in accepted), len(accepted)),
+        },
+        "threshold_sweep": [],
+    }
+    for candidate in SWEEP:
+        kept = [i for i, intent in enumerate(local) if escalation_reason(intent, products, candidate) is None]
+        report["threshold_sweep"].append({
+            "threshold": candidate,
+            "local_share": _rate(len(kept), len(corpus)),
+            "accepted_accuracy": _rate(sum(is_correct(corpus[i], local[i]) for i in kept), len(kept)),
+        })
+
+    llm = None
+    if use_llm:
+        if ai_parser.get_client() is None:
+            raise SystemExit("--llm needs OPENAI_API_KEY (and OPENAI_BASE_URL) pointing at a model")
+        fallbacks_before = LLM_FALLBACKS.total()
+        llm = [await PurchaseIntent._ai_parse(row["message"], products) for row in corpus]
+        cascade = [local[i] if reasons[i] is None else llm[i] for i in range(len(corpus))]
+        report["llm"] = {
+            "accuracy": _rate(sum(is_correct(row, p) for row, p in zip(corpus, llm)), len(corpus)),
+            "fell_back": int(LLM_FALLBACKS.total() - fallbacks_before),
+        }
+        report["cascade"] = {
+            "accuracy": _rate(sum(is_correct(row, p) for row, p in zip(corpus, cascade)), len(corpus)),
+            "llm_calls_saved": len(accepted),
+        }
+        report["agreement"] = {
+            "all": _rate(sum(agree(a, b) for a, b in zip(local, llm)), len(corpus)),
+            "accepted_by_local": _rate(sum(agree(local[i], llm[i]) for i in accepted), len(accepted)),
+        }
+
+    report["errors"] = [
+        {
+            "message": row["message"],
+            "expected": {key: row.get(key) for key in ("intent", "product", "quantity", "items") if row.get(key)},
+            "local": {"intent": local[i].intent.value, "items": _items(local[i]),
+                      "confidence": local[i].confidence, "escalation": reasons[i]},
+            **({"llm": {"intent": llm[i].intent.value, "items": _items(llm[i])}} if llm else {}),
+        }
+        for i, row in enumerate(corpus)
+        if not is_correct(row, local[i]) or (llm and not is_correct(row, llm[i]))
+    ]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL of {message, intent, product, quantity[, items]}")
+    parser.add_argument("--products", nargs="+", default=SEED_PRODUCTS)
+    parser.add_argument("--threshold", type=float, default=ai_parser.settings.cascade_confidence_threshold)
+    parser.add_argument("--llm", action="store_true", help="also score the LLM tier and tier agreement")
+    parser.add_argument("--show-errors", action="store_true", help="list messages a tier got wrong")
+    args = parser.parse_args()
+
+    report = asyncio.run(evaluate(load_corpus(args.corpus), args.products, args.threshold, args.llm))
+    if not args.show_errors:
+        report["errors"] = len(report["errors"])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Parse latency when the LLM upstream slows down or fails, with and without the call budget
+
+Phases against an in-process stub client:
+  slow      upstream takes --slow-delay per call; the budget should cap parse latency
+  burst     more concurrent parses than LLM_MAX_CONCURRENCY; the excess waits or falls back
+  outage    upstream fails every call; the breaker should open after LLM_BREAKER_FAILURES
+  recovery  upstream healthy again; after LLM_BREAKER_RESET one probe closes the breaker
+
+Usage:
+    python -m benchmarks.llm_budget_bench --timeout 1 --slow-delay 5 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks._common import summarize
+
+os.environ["INTENT_CACHE_SIZE"] = "0"
+os.environ.setdefault("OPENAI_API_KEY", "dummy-key-for-testing")
+
+from app import ai_parser  # noqa: E402
+from app.llm_guard import CLOSED, OPEN, CircuitBreaker, ConcurrencyLimit  # noqa: E402
+
+PRODUCTS = ("coke", "pepsi", "sprite", "fanta")
+
+
+class _StubCompletions:
+    def __init__(self):
+        self.delay = 0.05
+        self.fail = False
+        self.calls = 0
+
+    async def create(self, response_model, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("upstream unavailable")
+        return response_model._enhanced_fallback_parse(messages[-1]["content"], list(PRODUCTS))
+
+
+class StubLLMClient:
+    def __init__(self):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = _StubCompletions()
+
+
+def _configure(timeout: float, concurrency: int, failures: int, reset: float):
+    ai_parser.settings.llm_timeout = timeout
+    ai_parser.llm_limit = ConcurrencyLimit(concurrency)
+    ai_parser.llm_breaker = CircuitBreaker(failures, reset)
+
+
+async def _parse_many(count: int, message: str = "buy a coke"):
+    latencies = []
+
+    async def one(i):
+        started = time.perf_counter()
+        # Distinct messages so single-flight does not merge them
+        await ai_parser.parse_purchase_request(f"{message} {'please ' * (i % 7)}#{i}", PRODUCTS)
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies
+
+
+async def run(timeout: float, slow_delay: float, concurrency: int, burst: int, failures: int, reset: float) -> dict:
+    ai_parser.client = StubLLMClient()
+    upstream = ai_parser.client.chat.completions
+    results = {}
+
+    # Slow upstream: unguarded parses wait the full delay, guarded ones stop at the budget
+    upstream.delay = slow_delay
+    for mode, budget in (("unguarded", 0), ("guarded", timeout)):
+        _configure(budget, 0, 0, reset)
+        results[f"slow_{mode}"] = summarize(await _parse_many(20))
+    assert results["slow_guarded"]["max_ms"] < (timeout + 0.5) * 1000, results["slow_guarded"]
+
+    # Burst: only `concurrency` calls reach the upstream at once
+    upstream.delay = timeout / 4
+    _configure(timeout, concurrency, 0, reset)
+    peak = 0
+
+    async def watch():
+        nonlocal peak
+        while True:
+            peak = max(peak, ai_parser.llm_limit.in_flight)
+            await asyncio.sleep(0.001)
+
+    watcher = asyncio.ensure_future(watch())
+    latencies = await _parse_many(burst)
+    watcher.cancel()
+    results["burst"] = {"requests": burst, "peak_in_flight": peak, **summarize(latencies)}
+    assert peak <= concurrency, f"{peak} concurrent upstream calls with a cap of {concurrency}"
+
+    # Outage: after `failures` failed calls the breaker opens and parses skip the upstream
+    upstream.delay, upstream.fail = 0.05, True
+    _configure(timeout, concurrency, failures, reset)
+    calls_before = upstream.calls
+    for _ in range(failures):
+        await _parse_many(1)
+    assert ai_parser.llm_breaker.state == OPEN
+    open_latencies = await _parse_many(200)
+    results["outage"] = {
+        "upstream_calls": upstream.calls - calls_before,
+        "breaker": ai_parser.llm_breaker.stats(),
+        "open_latency": summarize(open_latencies),
+    }
+    assert upstream.calls - calls_before == failures, "breaker let calls through while open"
+
+    # Recovery: the first call after the reset timeout probes and closes the breaker
+    upstream.fail = False
+    await asyncio.sleep(reset)
+    await _parse_many(1)
+    results["recovery"] = {"breaker": ai_parser.llm_breaker.stats()}
+    assert ai_parser.llm_breaker.state == CLOSED
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timeout", type=float, default=1.0, help="LLM_TIMEOUT in seconds")
+    parser.add_argument("--slow-delay", type=float, default=3.0, help="upstream delay in the slow phase")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM_MAX_CONCURRENCY")
+    parser.add_argument("--burst", type=int, default=100, help="concurrent parses in the burst phase")
+    parser.add_argument("--failures", type=int, default=5, help="LLM_BREAKER_FAILURES")
+    parser.add_argument("--reset", type=float, default=1.0, help="LLM_BREAKER_RESET in seconds")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.timeout, args.slow_delay, args.concurrency, args.burst, args.failures, args.reset))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
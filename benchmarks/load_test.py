@@ -0,0 +1,349 @@
+"""
+End-to-end load test of app.main:app against a local stub LLM server
+
+For every seeded ledger size, the app runs under uvicorn twice: once with the LLM
+client pointed at benchmarks.stub_llm (AI path) and once without an API key (fallback
+path). Purchase users send a weighted mix of intents while reader users poll
+/inventory and page through /transactions. Results are written as JSON so runs from
+different commits can be compared.
+
+Usage:
+    python -m benchmarks.load_test --ledger-sizes 0 100000 1000000 --seconds 20
+    python -m benchmarks.load_test --llm-latency 0.5 --llm-error-rate 0.05 --llm-malformed-rate 0.1
+    python -m benchmarks.load_test --compare results/old.json results/new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from benchmarks._common import fill_ledger, summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESSAGES = {
+    "purchase": [
+        "buy a coke", "I want to buy 2 sprites", "give me a pepsi", "can I get 3 fantas please",
+        "I'd like to buy a dr pepper", "purchase 2 mountain dews",
+    ],
+    # Multi-item orders go to /purchase/batch; /purchase only sells one product
+    "batch": ["buy 2 cokes and a fanta", "I want a sprite and 2 pepsis", "give me 3 cokes and 2 sprites"],
+    "query": ["what do you have?", "show me the menu", "what's in stock?", "which drinks are available"],
+    "refuse": ["I don't want to buy anything", "no thanks, I don't want a soda"],
+    "cancel": ["cancel my order", "stop, cancel that"],
+    "unknown": ["hello there", "what's the weather like", "tell me a joke"],
+}
+DEFAULT_MIX = "purchase=55,batch=5,query=15,refuse=10,cancel=5,unknown=10"
+
+
+def _parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in MESSAGES:
+            raise argparse.ArgumentTypeError(f"unknown intent '{name}', expected one of {', '.join(MESSAGES)}")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_revision() -> Dict[str, Optional[str]]:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+def _start_server(module_app: str, port: int, env: Dict[str, str], extra_args: List[str] = ()) -> subprocess.Popen:
+    if module_app.endswith(":app"):
+        command = [sys.executable, "-m", "uvicorn", module_app, "--host", "127.0.0.1",
+                   "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", module_app, "--port", str(port), *extra_args]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+
+
+async def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 120):
+    import httpx
+
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(timeout=5) as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"server for {url} exited with code {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"server for {url} did not start within {timeout}s")
+
+
+def _stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _prepare(path: str, rows: int):
+    """Create, seed and fill one database; runs in a child process so the app binds to `path`"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["DEBUG"] = "false"
+    from app.database import create_db_and_tables, engine
+    from app.seed_data import seed_products
+
+    create_db_and_tables()
+    seed_products()
+    engine.dispose()
+    fill_ledger(path, rows)
+    db = sqlite3.connect(path)
+    # Keep purchases succeeding for the whole run
+    db.execute("UPDATE product SET stock = 1000000000")
+    db.commit()
+    # Fold the WAL into the main file so the template can be copied on its own
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close()
+
+
+async def _drive(base_url: str, seconds: float, purchase_users: int, reader_users: int,
+                 mix: Dict[str, float], seed: int) -> dict:
+    import httpx
+
+    rng = random.Random(seed)
+    intents, weights = list(mix), list(mix.values())
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    by_intent: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    deadline = time.perf_counter() + seconds
+
+    async def timed(name: str, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError:
+            errors[name] += 1
+            return None
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            errors[name] += 1
+            return None
+        latencies[name].append(elapsed)
+        return response
+
+    async def purchase_user(client):
+        while time.perf_counter() < deadline:
+            intent = rng.choices(intents, weights)[0]
+            message = rng.choice(MESSAGES[intent])
+            started = time.perf_counter()
+            if intent == "batch":
+                response = await timed("batch", client.post("/api/v1/purchase/batch", json={"message": message}))
+            else:
+                response = await timed("purchase", client.post("/api/v1/purchase", json={"message": message}))
+            if response is not None:
+                by_intent[intent].append(time.perf_counter() - started)
+
+    async def reader_user(client):
+        cursor = None
+        while time.perf_counter() < deadline:
+            await timed("inventory", client.get("/api/v1/inventory"))
+            params = {"limit": 50}
+            if cursor:
+                params["cursor"] = cursor
+            response = await timed("transactions", client.get("/api/v1/transactions", params=params))
+            # Walk a few pages back, then start again from the newest
+            cursor = response.headers.get("x-next-cursor") if response is not None and rng.random() < 0.75 else None
+
+    limits = httpx.Limits(max_connections=purchase_users + reader_users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(purchase_user(client) for _ in range(purchase_users)),
+            *(reader_user(client) for _ in range(reader_users)),
+        )
+        elapsed = time.perf_counter() - started
+
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": {
+            name: {**summarize(latencies[name]), "rps": round(len(latencies[name]) / elapsed, 1), "errors": errors[name]}
+            for name in ("purchase", "batch", "inventory", "transactions")
+        },
+        "purchase_by_intent": {intent: summarize(samples) for intent, samples in sorted(by_intent.items())},
+    }
+
+
+async def _run_case(args, template_db: str, rows: int, path: str, stub_url: str) -> dict:
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix="soda-load-")
+    db_path = os.path.join(workdir, "load.db")
+    shutil.copy(template_db, db_path)
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "DEBUG": "false",
+        "DB_PROFILE": args.db_profile,
+        "INTENT_CACHE_SIZE": str(args.intent_cache_size),
+        "PARSE_MODE": args.parse_mode,
+        "PARSE_BATCH_MAX_SIZE": str(args.parse_batch_size),
+        "PARSE_BATCH_MAX_WAIT_MS": str(args.parse_batch_wait_ms),
+        "OPENAI_BASE_URL": stub_url,
+        # The app only builds its LLM client for a real-looking key
+        "OPENAI_API_KEY": "stub-key" if path == "ai" else "dummy-key-for-testing",
+    }
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = _start_server("app.main:app", port, env)
+    try:
+        await _wait_ready(base_url + "/", server)
+        async with httpx.AsyncClient() as client:
+            stub_before = (await client.get(stub_url.rsplit("/v1", 1)[0] + "/stats")).json()
+        result = await _drive(base_url, args.seconds, args.purchase_users, args.reader_users, args.mix, args.seed)
+        async with httpx.AsyncClient() as client:
+            stub_after = (await client.get(stub_url.rsplit("/v1", 1)[0] + "/stats")).json()
+    finally:
+        _stop(server)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "ledger_rows": rows,
+        "path": path,
+        **result,
+        "llm_stub": {key: stub_after[key] - stub_before[key] for key in stub_after},
+    }
+
+
+async def run(args) -> dict:
+    stub_port = _free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}/v1"
+    stub = _start_server("benchmarks.stub_llm", stub_port, dict(os.environ), [
+        "--latency", str(args.llm_latency), "--jitter", str(args.llm_jitter),
+        "--error-rate", str(args.llm_error_rate), "--malformed-rate", str(args.llm_malformed_rate),
+        "--seed", str(args.seed),
+    ])
+    runs = []
+    try:
+        await _wait_ready(stub_url.rsplit("/v1", 1)[0] + "/stats", stub)
+        for rows in args.ledger_sizes:
+            template_dir = tempfile.mkdtemp(prefix="soda-load-template-")
+            template_db = os.path.join(template_dir, "template.db")
+            started = time.perf_counter()
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.load_test", "--prepare", template_db, "--rows", str(rows)],
+                cwd=REPO_ROOT, check=True,
+            )
+            print(f"seeded {rows} ledger rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            try:
+                for path in args.paths:
+                    result = await _run_case(args, template_db, rows, path, stub_url)
+                    runs.append(result)
+                    purchase = result["endpoints"]["purchase"]
+                    print(f"rows={rows} path={path}: purchase p95 {purchase['p95_ms']}ms at {purchase['rps']} req/s",
+                          file=sys.stderr)
+            finally:
+                shutil.rmtree(template_dir, ignore_errors=True)
+    finally:
+        _stop(stub)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare", "prepare", "rows")}
+    return {
+        "benchmark": "load_test",
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        **_git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "runs": runs,
+    }
+
+
+def compare(old_path: str, new_path: str):
+    """Print p50/p95/p99 and throughput changes between two result files"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    baseline = {(run["ledger_rows"], run["path"]): run for run in old["runs"]}
+    print(f"{(old.get('commit') or '?')[:10]} -> {(new.get('commit') or '?')[:10]}")
+    for run in new["runs"]:
+        before = baseline.get((run["ledger_rows"], run["path"]))
+        if before is None:
+            continue
+        for endpoint, stats in run["endpoints"].items():
+            previous = before["endpoints"].get(endpoint)
+            if previous is None:
+                continue
+            changes = []
+            for key in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+                delta = (stats[key] - previous[key]) / previous[key] * 100 if previous[key] else 0.0
+                changes.append(f"{key} {previous[key]} -> {stats[key]} ({delta:+.1f}%)")
+            print(f"rows={run['ledger_rows']:<8} {run['path']:<9} {endpoint:<13} " + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ledger-sizes", type=int, nargs="+", default=[0, 100000])
+    parser.add_argument("--paths", nargs="+", choices=["ai", "fallback"], default=["ai", "fallback"])
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--purchase-users", type=int, default=32, help="concurrent clients sending purchase messages")
+    parser.add_argument("--reader-users", type=int, default=4, help="concurrent clients polling the GET endpoints")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix(DEFAULT_MIX),
+                        help=f"intent weights for purchase messages (default: {DEFAULT_MIX})")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-malformed-rate", type=float, default=0.0)
+    parser.add_argument("--parse-mode", choices=["ai", "cascade"], default="ai", help="PARSE_MODE for the AI path")
+    parser.add_argument("--parse-batch-size", type=int, default=1, help="PARSE_BATCH_MAX_SIZE (1 disables batching)")
+    parser.add_argument("--parse-batch-wait-ms", type=float, default=5, help="PARSE_BATCH_MAX_WAIT_MS")
+    parser.add_argument("--intent-cache-size", type=int, default=0, help="INTENT_CACHE_SIZE for the app (0 disables)")
+    parser.add_argument("--db-profile", default=os.getenv("DB_PROFILE", "production"))
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/load_test-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files and exit")
+    parser.add_argument("--prepare", help=argparse.SUPPRESS)
+    parser.add_argument("--rows", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        _prepare(args.prepare, args.rows)
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = asyncio.run(run(args))
+    output = args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results", f"load_test-{(results['commit'] or 'unknown')[:10]}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["runs"], indent=2))
+    print(f"results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Machine-scoped inventory and purchases as the fleet grows
+
+For each fleet size, machines and their per-product stock rows are bulk-inserted, then
+GET /inventory?machine_id=... is timed for random machines. Latency should stay flat
+because one machine's stock is a primary-key range scan. A final phase races concurrent
+purchases across a few machines with small stock and fails on any oversell.
+
+Usage:
+    python -m benchmarks.machines_bench --fleet-sizes 10 1000 10000 --samples 300
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import time
+from datetime import datetime
+
+from benchmarks._common import summarize, use_temp_database
+
+DB_PATH = use_temp_database()
+
+import httpx  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.models import MachineStock, Product  # noqa: E402
+from sqlmodel import select  # noqa: E402
+
+PRODUCT_IDS = range(1, 7)
+
+
+def _grow_fleet(current: int, target: int, stock: int):
+    """Bulk-insert machines current+1..target, each carrying every seeded product"""
+    now = datetime.utcnow().isoformat(sep=" ")
+    db = sqlite3.connect(DB_PATH)
+    db.executemany(
+        "INSERT INTO machine (id, name, location, created_at) VALUES (?, ?, NULL, ?)",
+        ((machine_id, f"machine-{machine_id}", now) for machine_id in range(current + 1, target + 1)),
+    )
+    db.executemany(
+        "INSERT INTO machinestock (machine_id, product_id, stock, updated_at) VALUES (?, ?, ?, ?)",
+        ((machine_id, product_id, stock, now)
+         for machine_id in range(current + 1, target + 1) for product_id in PRODUCT_IDS),
+    )
+    db.commit()
+    db.close()
+
+
+def _inventory_plan() -> str:
+    from app.database import engine
+
+    statement = (
+        select(Product, MachineStock.stock)
+        .join(MachineStock, MachineStock.product_id == Product.id)
+        .where(MachineStock.machine_id == 1)
+    )
+    compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    db = sqlite3.connect(DB_PATH)
+    plan = " / ".join(row[-1] for row in db.execute(f"EXPLAIN QUERY PLAN {compiled}"))
+    db.close()
+    return plan
+
+
+async def run(fleet_sizes, samples: int, purchases: int, machines: int, stock: int) -> dict:
+    await app.router.startup()
+    rng = random.Random(5)
+    results = {"plan": _inventory_plan(), "inventory": []}
+    assert "SCAN machinestock" not in results["plan"], results["plan"]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        fleet = 0
+        for size in sorted(fleet_sizes):
+            _grow_fleet(fleet, size, stock)
+            fleet = size
+            latencies = []
+            for _ in range(samples):
+                started = time.perf_counter()
+                response = await client.get("/api/v1/inventory", params={"machine_id": rng.randint(1, fleet)})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            results["inventory"].append({"machines": fleet, "stock_rows": fleet * len(PRODUCT_IDS), **summarize(latencies)})
+
+        # Oversell check: many buyers racing for a few units in a handful of machines
+        racing = list(range(1, machines + 1))
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post("/api/v1/purchase", params={"machine_id": rng.choice(racing)}, json={"message": "buy a coke"})
+            for _ in range(purchases)
+        ))
+        elapsed = time.perf_counter() - started
+        sold = sum(1 for response in responses if response.json()["success"])
+        db = sqlite3.connect(DB_PATH)
+        remaining = db.execute(
+            f"SELECT SUM(stock), MIN(stock) FROM machinestock WHERE product_id = 1 AND machine_id <= {machines}"
+        ).fetchone()
+        recorded = db.execute(f"SELECT COUNT(*) FROM \"transaction\" WHERE machine_id <= {machines}").fetchone()[0]
+        db.close()
+    results["purchases"] = {
+        "requests": purchases, "machines": machines, "sold": sold, "remaining": remaining[0],
+        "ledger_rows": recorded, "purchases_per_s": round(purchases / elapsed, 1),
+    }
+    assert remaining[1] >= 0 and sold + remaining[0] == machines * stock, results["purchases"]
+    assert recorded == sold, results["purchases"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fleet-sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--samples", type=int, default=300, help="inventory requests per fleet size")
+    parser.add_argument("--purchases", type=int, default=300, help="concurrent purchases in the oversell phase")
+    parser.add_argument("--machines", type=int, default=5, help="machines the purchases are spread over")
+    parser.add_argument("--stock", type=int, default=20, help="units of each product per machine")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.fleet_sizes, args.samples, args.purchases, args.machines, args.stock))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Fallback parser micro-benchmark: compiled engine vs. the original per-message regex scan
+
+Usage:
+    python -m benchmarks.parser_bench --products 500 --messages 20000
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import time
+from typing import List, Optional
+
+from app.ai_parser import PurchaseIntent
+from app.parser_engine import get_engine
+
+SEED_PRODUCTS = ["coke", "pepsi", "sprite", "fanta", "mountain dew", "dr pepper"]
+ADJECTIVES = ["diet", "zero", "cherry", "vanilla", "wild", "classic", "light", "extra", "frozen", "spiced",
+              "golden", "sparkling", "ginger", "tropical", "citrus", "royal", "midnight", "sunny", "crisp", "mega"]
+FLAVORS = ["cola", "lime", "berry", "mango", "peach", "grape", "melon", "apple", "lemonade", "root beer",
+           "cream soda", "tonic", "punch", "orange", "kiwi", "guava", "papaya", "plum", "fizz", "splash",
+           "mint", "cherry", "cocoa", "tea", "coffee"]
+TEMPLATES = ["buy {q} {p}s", "I want a {p}", "give me {q} {p}", "can i have {q} bottles of {p}",
+             "what do you have?", "I don't want to buy anything", "cancel my order", "get {q} {p} please",
+             "hello there", "i'll take {q} cans of {p}"]
+
+
+def build_catalog(size: int) -> List[str]:
+    combos = [f"{a} {f}" for a, f in itertools.product(ADJECTIVES, FLAVORS)]
+    random.Random(7).shuffle(combos)
+    return SEED_PRODUCTS + combos[: max(0, size - len(SEED_PRODUCTS))]
+
+
+def build_messages(products: List[str], count: int) -> List[str]:
+    rng = random.Random(11)
+    return [
+        rng.choice(TEMPLATES).format(q=rng.randint(1, 9), p=rng.choice(products))
+        for _ in range(count)
+    ]
+
+
+def legacy_extract_product(message: str, available_products: List[str]) -> Optional[str]:
+    for product in available_products:
+        if product in message:
+            return product
+    return None
+
+
+def legacy_extract_quantity(message: str) -> int:
+    quantity_patterns = [
+        r'(\d+)\s*(?:cans?|bottles?|sodas?|cokes?|pepsis?|sprites?|fantas?|mountain\s*dews?|dr\s*peppers?)',
+        r'(?:buy|get|want|need)\s+(\d+)',
+        r'(\d+)\s+(?:coke|pepsi|sprite|fanta|mountain\s*dew|dr\s*pepper)'
+    ]
+    for pattern in quantity_patterns:
+        match = re.search(pattern, message)
+        if match:
+            return int(match.group(1))
+    return 1
+
+
+def legacy_parse(message: str, available_products: List[str]):
+    """The fallback parser as it was before the compiled engine"""
+    message_lower = message.lower().strip()
+    negative_patterns = [
+        r'\b(?:dont|don\'t|not|no|never|refuse|decline|cancel|stop)\b',
+        r'\b(?:dont|don\'t)\s+(?:want|need|buy|purchase)\b',
+        r'\b(?:not|no)\s+(?:thanks|thank you|interested)\b'
+    ]
+    has_negative = any(re.search(pattern, message_lower) for pattern in negative_patterns)
+    purchase_patterns = [
+        r'\b(?:buy|purchase|get|want|need)\b',
+        r'\b(?:give me|i\'ll take|i want)\b',
+        r'\b(?:can i have|may i have)\b'
+    ]
+    has_purchase_keyword = any(re.search(pattern, message_lower) for pattern in purchase_patterns)
+    query_patterns = [
+        r'\b(?:what|which|how many|show me|list|available)\b',
+        r'\b(?:do you have|what\'s available)\b',
+        r'\b(?:inventory|stock|products)\b'
+    ]
+    has_query_keyword = any(re.search(pattern, message_lower) for pattern in query_patterns)
+    cancel_patterns = [
+        r'\b(?:cancel|stop|abort|undo)\b',
+        r'\b(?:never mind|forget it)\b'
+    ]
+    has_cancel_keyword = any(re.search(pattern, message_lower) for pattern in cancel_patterns)
+    if has_negative and has_purchase_keyword:
+        return PurchaseIntent(intent="refuse", confidence=0.9, reasoning="negative")
+    elif has_cancel_keyword:
+        return PurchaseIntent(intent="cancel", confidence=0.8, reasoning="cancel")
+    elif has_query_keyword:
+        return PurchaseIntent(intent="query", confidence=0.85, reasoning="query")
+    elif has_purchase_keyword and not has_negative:
+        product_name = legacy_extract_product(message_lower, available_products)
+        quantity = legacy_extract_quantity(message_lower)
+        return PurchaseIntent(intent="purchase", product_name=product_name, quantity=quantity,
+                              confidence=0.7 if product_name else 0.3, reasoning="purchase")
+    return PurchaseIntent(intent="unknown", confidence=0.5, reasoning="unknown")
+
+
+def _throughput(fn, messages: List[str], products: List[str]) -> float:
+    started = time.perf_counter()
+    for message in messages:
+        fn(message, products)
+    return len(messages) / (time.perf_counter() - started)
+
+
+def run(product_count: int, message_count: int) -> dict:
+    # The catalog hands the parser an immutable tuple of names
+    products = tuple(build_catalog(product_count))
+    messages = build_messages(products, message_count)
+
+    build_started = time.perf_counter()
+    get_engine(products)
+    build_ms = (time.perf_counter() - build_started) * 1000
+
+    legacy = _throughput(legacy_parse, messages, products)
+    compiled = _throughput(PurchaseIntent._enhanced_fallback_parse, messages, products)
+
+    resolved_legacy = sum(1 for m in messages if legacy_parse(m, products).product_name)
+    resolved_compiled = sum(1 for m in messages if PurchaseIntent._enhanced_fallback_parse(m, products).product_name)
+
+    return {
+        "products": len(products),
+        "messages": len(messages),
+        "engine_build_ms": round(build_ms, 3),
+        "legacy_msgs_per_sec": round(legacy),
+        "compiled_msgs_per_sec": round(compiled),
+        "speedup": round(compiled / legacy, 2),
+        "products_resolved_legacy": resolved_legacy,
+        "products_resolved_compiled": resolved_compiled,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.products, args.messages), indent=2))
+
+
+if __name__ == "__main__":
+    main()
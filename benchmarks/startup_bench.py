@@ -0,0 +1,128 @@
+"""
+Cold-start cost of the app with STARTUP_MODE=eager and STARTUP_MODE=lazy
+
+For each mode and repeat, against a fresh database and a local stub LLM server:
+  import         seconds to `import app.main` in a new interpreter
+  first_request  seconds from launching uvicorn until GET /api/v1/inventory answers
+  first_purchase latency of the first AI-parsed purchase (builds the client when lazy)
+  next_purchase  latency of a second purchase, for comparison
+  inventory_max  slowest GET /api/v1/inventory polled while the first purchase runs;
+                 close to first_purchase means the client build blocked the event loop
+
+Usage:
+    python -m benchmarks.startup_bench --repeats 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from benchmarks.load_test import REPO_ROOT, _free_port, _start_server, _stop, _wait_ready
+
+MODES = ("eager", "lazy")
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def _measure_import(env: Dict[str, str]) -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=REPO_ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+async def _measure_server(env: Dict[str, str]) -> Dict[str, float]:
+    import httpx
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = _start_server("app.main:app", port, env)
+    try:
+        async with httpx.AsyncClient(timeout=30) as client:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"server exited with code {server.returncode}")
+                try:
+                    if (await client.get(base_url + "/api/v1/inventory")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.01)
+            first_request = time.perf_counter() - started
+
+            timings = {"first_request": first_request}
+            purchasing = True
+
+            async def poll_inventory() -> float:
+                slowest = 0.0
+                while purchasing:
+                    sent = time.perf_counter()
+                    (await client.get(base_url + "/api/v1/inventory")).raise_for_status()
+                    slowest = max(slowest, time.perf_counter() - sent)
+                    await asyncio.sleep(0.01)
+                return slowest
+
+            poller = asyncio.ensure_future(poll_inventory())
+            for name in ("first_purchase", "next_purchase"):
+                sent = time.perf_counter()
+                response = await client.post(base_url + "/api/v1/purchase", json={"message": "buy a coke"})
+                response.raise_for_status()
+                timings[name] = time.perf_counter() - sent
+                purchasing = False
+            timings["inventory_max"] = await poller
+            return timings
+    finally:
+        _stop(server)
+
+
+async def run(repeats: int, llm_latency: float) -> dict:
+    stub_port = _free_port()
+    stub = _start_server("benchmarks.stub_llm", stub_port, dict(os.environ), ["--latency", str(llm_latency)])
+    samples = {mode: {"import": [], "first_request": [], "first_purchase": [], "next_purchase": [], "inventory_max": []} for mode in MODES}
+    try:
+        await _wait_ready(f"http://127.0.0.1:{stub_port}/stats", stub)
+        for _ in range(repeats):
+            # Alternate modes so drift in machine load affects both alike
+            for mode in MODES:
+                workdir = tempfile.mkdtemp(prefix="soda-startup-")
+                env = {
+                    **os.environ,
+                    "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+                    "DEBUG": "false",
+                    "STARTUP_MODE": mode,
+                    "INTENT_CACHE_SIZE": "0",
+                    "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+                    "OPENAI_API_KEY": "stub-key",
+                }
+                try:
+                    samples[mode]["import"].append(_measure_import(env))
+                    for name, seconds in (await _measure_server(env)).items():
+                        samples[mode][name].append(seconds)
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        _stop(stub)
+    return {
+        mode: {name: round(statistics.median(values) * 1000, 1) for name, values in measured.items()}
+        for mode, measured in samples.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM response delay in seconds")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.repeats, args.llm_latency))
+    print("median milliseconds per phase")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
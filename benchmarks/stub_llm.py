@@ -0,0 +1,168 @@
+"""
+Local OpenAI-compatible chat completions server for load tests
+
+Answers Instructor's TOOLS-mode requests with a tool call whose arguments come from
+the app's own fallback parser, after a configurable delay. A share of requests can
+fail with an HTTP error or return malformed output, to exercise retries and fallback.
+Batched parses (numbered messages, an "intents" list) are answered per message, and
+malformed output then corrupts or drops single entries.
+
+Usage:
+    python -m benchmarks.stub_llm --port 11434 --latency 0.3 --jitter 0.1 --error-rate 0.02 --malformed-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:11434/v1 OPENAI_API_KEY=stub uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.ai_parser import PurchaseIntent
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.2
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+    malformed_rate: float = 0.0
+    seed: int = 7
+
+
+def _available_products(messages: List[dict]) -> List[str]:
+    for message in messages:
+        content = message.get("content") or ""
+        if message.get("role") == "system" and "Available products:" in content:
+            line = content.split("Available products:", 1)[1].splitlines()[0]
+            return [name.strip() for name in line.split(",") if name.strip()]
+    return []
+
+
+def _malformed_arguments(rng: random.Random, intent: Dict) -> str:
+    """One of the ways a model gets structured output wrong"""
+    kind = rng.choice(["truncated", "out_of_range", "missing_field"])
+    if kind == "truncated":
+        return json.dumps(intent)[: rng.randint(1, 20)]
+    if kind == "out_of_range":
+        return json.dumps({**intent, "confidence": 7})
+    return json.dumps({key: value for key, value in intent.items() if key != "intent"})
+
+
+_NUMBERED = re.compile(r"^\[(\d+)\]\s?(.*)$")
+
+
+def _batch_arguments(rng: random.Random, config: StubConfig, counters: Dict[str, int],
+                     user_message: str, products: List[str]) -> str:
+    """One entry per numbered message; malformed output corrupts or drops individual entries"""
+    intents = []
+    for line in user_message.splitlines():
+        match = _NUMBERED.match(line.strip())
+        if match is None:
+            continue
+        entry = {"index": int(match.group(1)),
+                 **PurchaseIntent._enhanced_fallback_parse(match.group(2), products).model_dump(mode="json")}
+        if rng.random() < config.malformed_rate:
+            counters["malformed"] += 1
+            kind = rng.choice(["drop", "out_of_range", "bad_intent"])
+            if kind == "drop":
+                continue
+            entry.update({"confidence": 7} if kind == "out_of_range" else {"intent": "maybe"})
+        intents.append(entry)
+    return json.dumps({"intents": intents})
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="Stub LLM")
+    rng = random.Random(config.seed)
+    counters = {"requests": 0, "batches": 0, "errors": 0, "malformed": 0, "ok": 0, "prompt_tokens": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        counters["requests"] += 1
+        # Rough token count (4 characters per token), enough to compare prompt overhead between runs
+        prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+        counters["prompt_tokens"] += prompt_tokens
+        await asyncio.sleep(max(0.0, rng.gauss(config.latency, config.jitter)))
+
+        if rng.random() < config.error_rate:
+            counters["errors"] += 1
+            return JSONResponse(
+                status_code=config.error_status,
+                content={"error": {"message": "stub failure", "type": "server_error", "code": None}},
+            )
+
+        messages = body.get("messages", [])
+        user_message = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        tools = body.get("tools") or []
+        schema = tools[0]["function"].get("parameters", {}) if tools else {}
+        if "intents" in schema.get("properties", {}):
+            counters["batches"] += 1
+            counters["ok"] += 1
+            arguments = _batch_arguments(rng, config, counters, user_message, _available_products(messages))
+        else:
+            intent = PurchaseIntent._enhanced_fallback_parse(user_message, _available_products(messages))
+            intent_args = intent.model_dump(mode="json")
+            if rng.random() < config.malformed_rate:
+                counters["malformed"] += 1
+                arguments = _malformed_arguments(rng, intent_args)
+            else:
+                counters["ok"] += 1
+                arguments = json.dumps(intent_args)
+
+        if tools:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": tools[0]["function"]["name"], "arguments": arguments},
+                }],
+            }
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": arguments}
+            finish_reason = "stop"
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 0, "total_tokens": prompt_tokens},
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.2, help="mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an HTTP error")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of responses with invalid tool arguments")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.error_status, args.malformed_rate, args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+/transactions page latency over a large synthetic ledger
+
+Pages are fetched at several depths of the ledger, with and without filters, to
+show that a keyset page costs the same no matter how far back it starts.
+
+Usage:
+    python -m benchmarks.transactions_bench --rows 2000000
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from benchmarks._common import fill_ledger, summarize, use_temp_database
+
+DB_PATH = use_temp_database("ledger.db")
+
+import httpx  # noqa: E402
+
+from app.database import create_db_and_tables  # noqa: E402
+from app.main import app  # noqa: E402
+from app.pagination import encode_cursor  # noqa: E402
+from app.seed_data import seed_products  # noqa: E402
+
+
+def cursor_at_depth(fraction: float, where: str = "") -> str:
+    """Cursor positioned `fraction` of the way back through the (filtered) ledger"""
+    with sqlite3.connect(DB_PATH) as db:
+        total = db.execute(f'SELECT COUNT(*) FROM "transaction" {where}').fetchone()[0]
+        created_at, row_id = db.execute(
+            f'SELECT created_at, id FROM "transaction" {where} ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?',
+            (int(total * fraction),),
+        ).fetchone()
+    return encode_cursor(datetime.fromisoformat(created_at), row_id)
+
+
+async def time_page(client: httpx.AsyncClient, params: dict, repeats: int):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = await client.get("/api/v1/transactions", params=params)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+async def run(rows: int, limit: int, repeats: int) -> dict:
+    create_db_and_tables()
+    seed_products()
+    started = time.perf_counter()
+    ledger_start = fill_ledger(DB_PATH, rows)
+    fill_s = time.perf_counter() - started
+
+    report = {"rows": rows, "page_size": limit, "fill_s": round(fill_s, 1), "pages": {}}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for depth in (0.0, 0.5, 0.99):
+            params = {"limit": limit}
+            if depth:
+                params["cursor"] = cursor_at_depth(depth)
+            report["pages"][f"all@{depth:.0%}"] = await time_page(client, params, repeats)
+
+            params = {"limit": limit, "product_id": 3}
+            if depth:
+                params["cursor"] = cursor_at_depth(depth, "WHERE product_id = 3")
+            report["pages"][f"product_id@{depth:.0%}"] = await time_page(client, params, repeats)
+
+            params = {"limit": limit, "status": "refunded"}
+            if depth:
+                params["cursor"] = cursor_at_depth(depth, "WHERE status = 'refunded'")
+            report["pages"][f"status@{depth:.0%}"] = await time_page(client, params, repeats)
+
+        window = {
+            "limit": limit,
+            "since": (ledger_start + timedelta(days=30)).isoformat(),
+            "until": (ledger_start + timedelta(days=31)).isoformat(),
+        }
+        report["pages"]["one_day_window"] = await time_page(client, window, repeats)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.rows, args.limit, args.repeats)), indent=2))
+
+
+if __name__ == "__main__":
+    main()